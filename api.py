@@ -0,0 +1,408 @@
+import argparse
+import asyncio
+import hashlib
+import http.client
+import json
+import math
+import os
+import traceback
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from room_manager import CONFLICT_MESSAGE, get_room_manager
+
+# خدمة HTTP/JSON محلية لقراءة الأرصدة وتسجيل المدفوعات من أدوات أخرى بدون الواجهة:
+#   GET  /rooms?start=0&count=50     صفحة من الغرف
+#   GET  /rooms/<رقم>                غرفة واحدة، مع ETag
+#   POST /bill/calculate             {"amount": 12000}
+#   POST /bill/apply                 {"amount": 12000}
+#   POST /rooms/<رقم>/pay            {"amount": 150}، ويقبل If-Match بنسخة الغرفة أو *
+#   POST /rooms/<رقم>/reset
+#   POST /undo و POST /redo         التراجع عن آخر فاتورة أو سداد أو تصفير وإعادته
+# التراجع يخص عمليات نفس الجلسة، والجلسة تحدد برأس X-Session (كل الطلبات بدونه جلسة واحدة)
+#   POST /batch                      {"requests": [{"method": ..., "path": ..., "body": ...}, ...]}
+# التعديلات ترد بعد تطبيقها في الذاكرة، وإضافة ?wait=1 تنتظر حفظها على القرص
+
+API_HOST = os.environ.get("ROOMS_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("ROOMS_API_PORT", "8765"))
+
+# أكبر عدد غرف في الصفحة الواحدة، والعدد الافتراضي إذا لم يحدد
+API_PAGE_LIMIT = 500
+API_PAGE_SIZE = 50
+
+# أقصى عدد طلبات في دفعة واحدة
+API_BATCH_LIMIT = 100
+
+# أقصى حجم لجسم الطلب ولرؤوسه بالبايت
+API_MAX_BODY = 1024 * 1024
+API_MAX_HEADERS = 64 * 1024
+
+# مدة بقاء الاتصال مفتوحاً بدون طلبات بالثواني
+KEEP_ALIVE_TIMEOUT = 15
+
+# مدة انتظار الحفظ على القرص عند طلبه
+DURABLE_TIMEOUT = 10
+
+# معرف لتشغيل الخدمة الحالي، نسخ الغرف تبدأ من الصفر بعد كل تشغيل فلا تطابق ETag قديماً
+BOOT_ID = os.urandom(4).hex()
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def room_etag(version):
+    return f'"{BOOT_ID}-{version}"'
+
+
+def version_from_etag(etag):
+    # النسخة من ETag أعطي سابقاً، وETag من تشغيل آخر أو غير صالح يعامل كتعارض
+    # و"*" يطابق أي نسخة حالية للغرفة فيعيد None بدون تحقق من النسخة
+    etag = etag.strip()
+    if etag == "*":
+        return None
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    boot, _, version = etag.strip('"').partition("-")
+    if boot != BOOT_ID or not version.isdigit():
+        raise ApiError(HTTPStatus.PRECONDITION_FAILED, CONFLICT_MESSAGE)
+    return int(version)
+
+
+def room_json(room_num, room):
+    return {
+        "room": room_num,
+        "name": room.name,
+        "has_laptop": room.has_laptop,
+        "no_laptop": room.no_laptop,
+        "balance": round(room.balance, 2),
+        "version": room.version,
+    }
+
+
+def query_int(query, name, default):
+    try:
+        return int(query.get(name, [default])[0])
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f'قيمة {name} يجب أن تكون رقماً')
+
+
+def body_amount(body):
+    # المبلغ رقم JSON محدود فقط، فالنصوص والقيم المنطقية وNaN وInfinity ترفض
+    if not isinstance(body, dict) or body.get("amount") is None:
+        raise ApiError(HTTPStatus.BAD_REQUEST, 'يرجى إدخال المبلغ')
+    amount = body["amount"]
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+        raise ApiError(HTTPStatus.BAD_REQUEST, 'قيمة المبلغ يجب أن تكون رقمية')
+    try:
+        amount = float(amount)
+    except OverflowError:
+        amount = math.inf
+    if not math.isfinite(amount):
+        raise ApiError(HTTPStatus.BAD_REQUEST, 'قيمة المبلغ يجب أن تكون رقمية')
+    return amount
+
+
+class ApiServer:
+    def __init__(self, room_manager=None):
+        self.room_manager = room_manager or get_room_manager()
+        self.server = None
+
+    async def start(self, host=API_HOST, port=API_PORT):
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=API_MAX_HEADERS)
+        return self.server
+
+    async def serve_forever(self, host=API_HOST, port=API_PORT):
+        await self.start(host, port)
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        # اتصال واحد يخدم طلبات متتالية حتى يطلب العميل إغلاقه أو تنتهي مدة الانتظار
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self.send(writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE,
+                                    {"error": 'رؤوس الطلب كبيرة جداً'}, keep_alive=False)
+                    return
+
+                try:
+                    method, target, version, headers = self.parse_head(head)
+                    length = int(headers.get("content-length", "0"))
+                    if length < 0 or length > API_MAX_BODY:
+                        raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'جسم الطلب كبير جداً')
+                    if "chunked" in headers.get("transfer-encoding", ""):
+                        raise ApiError(HTTPStatus.LENGTH_REQUIRED, 'يرجى إرسال طول جسم الطلب')
+                except (ApiError, ValueError) as e:
+                    error = e if isinstance(e, ApiError) else ApiError(HTTPStatus.BAD_REQUEST, 'طلب غير صالح')
+                    await self.send(writer, error.status, {"error": error.message}, keep_alive=False)
+                    return
+                raw_body = await reader.readexactly(length) if length else b""
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" and (version == "HTTP/1.1" or connection == "keep-alive")
+
+                status, payload, extra = await self.handle_request(method, target, headers, raw_body)
+                await self.send(writer, status, payload, extra, keep_alive, head_only=method == "HEAD")
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+        finally:
+            writer.close()
+
+    def parse_head(self, head):
+        lines = head.decode('latin-1').split("\r\n")
+        method, target, version = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        return method.upper(), target, version.strip(), headers
+
+    async def send(self, writer, status, payload, extra=None, keep_alive=True, head_only=False):
+        # الرد JSON صالح دائماً، والقيم غير المحدودة لا ترسل كـ NaN
+        try:
+            body = b"" if payload is None else json.dumps(payload, ensure_ascii=False, allow_nan=False).encode('utf-8')
+        except ValueError:
+            status, extra = HTTPStatus.INTERNAL_SERVER_ERROR, None
+            body = json.dumps({"error": 'قيمة غير صالحة في بيانات الرد'}, ensure_ascii=False).encode('utf-8')
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+        if payload is not None:
+            lines.append("Content-Type: application/json; charset=utf-8")
+        lines.append(f"Content-Length: {len(body)}")
+        for name, value in (extra or {}).items():
+            lines.append(f"{name}: {value}")
+        if keep_alive:
+            lines.append("Connection: keep-alive")
+            lines.append(f"Keep-Alive: timeout={KEEP_ALIVE_TIMEOUT}")
+        else:
+            lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + (b"" if head_only else body))
+        await writer.drain()
+
+    async def handle_request(self, method, target, headers, raw_body):
+        # يعيد (الحالة، جسم الرد، رؤوس إضافية)
+        try:
+            body = json.loads(raw_body) if raw_body else None
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, {"error": 'جسم الطلب ليس JSON صالحاً'}, {}
+
+        # الطلب ينتظر قفل الغرف وقد يقرأ من القرص، فينفذ خارج حلقة الأحداث حتى لا يوقف حفظ بطيء باقي الاتصالات
+        # والخطأ غير المتوقع يسجل ويرد عليه بخطأ داخلي بدل قطع الاتصال بدون رد
+        loop = asyncio.get_running_loop()
+        try:
+            status, payload, extra, wait = await loop.run_in_executor(None, self.dispatch, method, target, headers, body)
+            if wait and status == HTTPStatus.OK:
+                if not await loop.run_in_executor(None, self.room_manager.wait_durable, DURABLE_TIMEOUT):
+                    return HTTPStatus.SERVICE_UNAVAILABLE, {"error": 'تم التعديل لكن لم يكتمل حفظه بعد'}, {}
+        except Exception:
+            traceback.print_exc()
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": 'خطأ داخلي في الخدمة'}, {}
+        return status, payload, extra
+
+    def dispatch(self, method, target, headers, body, in_batch=False):
+        # يعيد (الحالة، جسم الرد، رؤوس إضافية، هل ينتظر الرد حفظ التعديل على القرص)
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip("/").split("/") if part]
+        query = parse_qs(url.query)
+        wait = method == "POST" and query.get("wait", ["0"])[0] == "1"
+        try:
+            if parts == ["batch"] and method == "POST" and not in_batch:
+                return self.batch(body, headers, wait)
+            return (*self.route(method, parts, query, headers, body), wait)
+        except ApiError as e:
+            return e.status, {"error": e.message}, {}, False
+
+    def route(self, method, parts, query, headers, body):
+        read = method in ("GET", "HEAD")
+        session = ("api", headers.get("x-session", ""))
+        if parts == ["rooms"] and read:
+            return self.list_rooms(query, headers)
+        if len(parts) == 2 and parts[0] == "rooms" and read:
+            return self.get_room(parts[1], headers)
+        if parts == ["bill", "calculate"] and method == "POST":
+            return self.calculate_bill(body)
+        if parts == ["bill", "apply"] and method == "POST":
+            return self.apply_bill(body, session)
+        if len(parts) == 3 and parts[0] == "rooms" and parts[2] in ("pay", "reset") and method == "POST":
+            return self.change_room(parts[1], parts[2], headers, body, session)
+        if parts in (["undo"], ["redo"]) and method == "POST":
+            return self.undo_redo(parts[0], session)
+        if parts and parts[0] in ("rooms", "bill", "batch", "undo", "redo"):
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, 'الطريقة غير مدعومة لهذا المسار')
+        raise ApiError(HTTPStatus.NOT_FOUND, 'المسار غير موجود')
+
+    def list_rooms(self, query, headers):
+        start = max(0, query_int(query, "start", 0))
+        count = min(API_PAGE_LIMIT, max(1, query_int(query, "count", API_PAGE_SIZE)))
+        manager = self.room_manager
+        with manager.lock:
+            total = len(manager.rooms)
+            page = [room_json(room_num, room) for room_num, room in manager.rooms.page(start, count)]
+
+        # بصمة أرقام الغرف ونسخها بالترتيب تتغير بتعديل أي غرفة في الصفحة أو تغير الغرف فيها
+        digest = hashlib.blake2b(digest_size=8)
+        for room in page:
+            digest.update(f'{room["room"]}\0{room["version"]}\0'.encode('utf-8'))
+        etag = f'"{BOOT_ID}-{total}-{start}-{count}-{digest.hexdigest()}"'
+        if etag in headers.get("if-none-match", ""):
+            return HTTPStatus.NOT_MODIFIED, None, {"ETag": etag}
+        return HTTPStatus.OK, {"start": start, "count": len(page), "total": total, "rooms": page}, {"ETag": etag}
+
+    def room_data(self, room_num):
+        manager = self.room_manager
+        with manager.lock:
+            room = manager.rooms.get(room_num)
+            if room is None:
+                raise ApiError(HTTPStatus.NOT_FOUND, 'رقم الغرفة غير موجود')
+            return room_json(room_num, room)
+
+    def get_room(self, room_num, headers):
+        data = self.room_data(room_num)
+        etag = room_etag(data["version"])
+        if etag in headers.get("if-none-match", ""):
+            return HTTPStatus.NOT_MODIFIED, None, {"ETag": etag}
+        return HTTPStatus.OK, data, {"ETag": etag}
+
+    def bill_shares(self, body):
+        amount = body_amount(body)
+        student_share, laptop_share, error = self.room_manager.calculate_bill(amount)
+        if error:
+            raise ApiError(HTTPStatus.BAD_REQUEST, error)
+        return {"bill_amount": amount, "student_share": student_share, "laptop_share": laptop_share}
+
+    def calculate_bill(self, body):
+        return HTTPStatus.OK, self.bill_shares(body), {}
+
+    def apply_bill(self, body, session):
+        bill = self.bill_shares(body)
+        self.room_manager.apply_bill_to_rooms(bill["student_share"], bill["laptop_share"], session)
+        return HTTPStatus.OK, {**bill, "rooms": len(self.room_manager.rooms)}, {}
+
+    def change_room(self, room_num, action, headers, body, session):
+        manager = self.room_manager
+        expected_version = None
+        if isinstance(body, dict) and body.get("version") is not None:
+            expected_version = body["version"]
+        if "if-match" in headers:
+            expected_version = version_from_etag(headers["if-match"])
+        if room_num not in manager.rooms:
+            raise ApiError(HTTPStatus.NOT_FOUND, 'رقم الغرفة غير موجود')
+
+        if action == "pay":
+            success, message, _ = manager.pay_room_bill(room_num, body_amount(body), expected_version, session)
+        else:
+            success, message = manager.reset_room_bill(room_num, expected_version, session)
+        if not success:
+            status = HTTPStatus.PRECONDITION_FAILED if message == CONFLICT_MESSAGE else HTTPStatus.BAD_REQUEST
+            raise ApiError(status, message)
+
+        data = self.room_data(room_num)
+        data["message"] = message
+        return HTTPStatus.OK, data, {"ETag": room_etag(data["version"])}
+
+    def undo_redo(self, action, session):
+        manager = self.room_manager
+        success, message = manager.undo(session) if action == "undo" else manager.redo(session)
+        if not success:
+            raise ApiError(HTTPStatus.CONFLICT, message)
+        return HTTPStatus.OK, {"message": message}, {}
+
+    def batch(self, body, batch_headers, wait):
+        # عدة طلبات في طلب واحد تنفذ بالترتيب، وفشل أحدها لا يوقف الباقي
+        # والحفظ ينتظر مرة واحدة بعد الدفعة إذا طلبته الدفعة أو أحد طلباتها
+        requests = body.get("requests") if isinstance(body, dict) else None
+        if not isinstance(requests, list):
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'يرجى إرسال قائمة الطلبات')
+        if len(requests) > API_BATCH_LIMIT:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f'أقصى عدد طلبات في الدفعة {API_BATCH_LIMIT}')
+
+        responses = []
+        for request in requests:
+            if (not isinstance(request, dict) or not isinstance(request.get("path"), str)
+                    or not isinstance(request.get("headers") or {}, dict)):
+                responses.append({"status": HTTPStatus.BAD_REQUEST.value, "body": {"error": 'طلب غير صالح'}})
+                continue
+            # طلبات الدفعة من نفس جلسة الدفعة إلا إذا حدد الطلب جلسته
+            headers = {"x-session": batch_headers.get("x-session", "")}
+            headers.update((name.lower(), str(value)) for name, value in (request.get("headers") or {}).items())
+            status, payload, extra, request_wait = self.dispatch(
+                str(request.get("method", "GET")).upper(), request["path"], headers, request.get("body"),
+                in_batch=True
+            )
+            wait = wait or (request_wait and status == HTTPStatus.OK)
+            response = {"status": status.value, "body": payload}
+            if "ETag" in extra:
+                response["etag"] = extra["ETag"]
+            responses.append(response)
+        return HTTPStatus.OK, {"responses": responses}, {}, wait
+
+
+class ApiClient:
+    # عميل بسيط باتصال واحد مفتوح، للأدوات المحلية ولتجربة الخدمة
+    def __init__(self, host=API_HOST, port=API_PORT, timeout=30):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        # آخر ETag لكل مسار وجسمه، لإعادة استخدامه إذا رد الخادم بأنه لم يتغير
+        self.cache = {}
+
+    def request(self, method, path, body=None, headers=None):
+        # يعيد (الحالة، جسم الرد، ETag)
+        headers = dict(headers or {})
+        data = None
+        if body is not None:
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            headers["Content-Type"] = "application/json"
+        self.connection.request(method, path, data, headers)
+        response = self.connection.getresponse()
+        raw = response.read()
+        return response.status, json.loads(raw) if raw else None, response.getheader("ETag")
+
+    def get(self, path):
+        # قراءة مشروطة: الجسم المحفوظ يعاد بدون نقله مجدداً إذا لم يتغير
+        cached = self.cache.get(path)
+        headers = {"If-None-Match": cached[0]} if cached else None
+        status, body, etag = self.request("GET", path, headers=headers)
+        if status == HTTPStatus.NOT_MODIFIED:
+            return HTTPStatus.OK.value, cached[1]
+        if status == HTTPStatus.OK and etag:
+            self.cache[path] = (etag, body)
+        return status, body
+
+    def post(self, path, body=None, etag=None):
+        return self.request("POST", path, body, {"If-Match": etag} if etag else None)[:2]
+
+    def batch(self, requests):
+        status, body = self.post("/batch", {"requests": requests})
+        return body["responses"] if status == HTTPStatus.OK else body
+
+    def close(self):
+        self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="خدمة HTTP/JSON لإدارة الغرف")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+
+    server = ApiServer()
+    print(f"الخدمة تعمل على http://{args.host}:{args.port}", flush=True)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.room_manager.flush()
+
+
+if __name__ == "__main__":
+    main()
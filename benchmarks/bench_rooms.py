@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# أحجام البيانات الافتراضية وعدد مرات تنفيذ العمليات السريعة في كل حجم
+DEFAULT_SIZES = (10, 1000, 100000, 1000000)
+DEFAULT_OPERATIONS = 2000
+BILL_REPEATS = 5
+
+
+def synthetic_roster(size, seed=0):
+    # غرف موزعة على تسعة مبان بأعداد طلاب ومبالغ عشوائية ثابتة لنفس البذرة
+    rng = random.Random(seed)
+    return {
+        f"{i % 9 + 1}{i:07d}": [f"طالب {i}", rng.randrange(4), rng.randrange(4), round(rng.uniform(0, 500), 2)]
+        for i in range(size)
+    }
+
+
+def summarize(operation, samples):
+    # زمن كل استدعاء بالثواني -> الإنتاجية ونسب التأخير
+    ordered = sorted(samples)
+    total = sum(ordered)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    return {
+        "operation": operation,
+        "count": len(ordered),
+        "total_seconds": total,
+        "throughput_per_second": len(ordered) / total if total else None,
+        "p50_ms": percentile(50) * 1000,
+        "p90_ms": percentile(90) * 1000,
+        "p99_ms": percentile(99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def peak_memory_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS تعيدها بالبايت وLinux بالكيلوبايت
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_single(size, backend, operations, seed):
+    from room_manager import RoomManager
+    from storage import make_storage
+
+    results = []
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        records = synthetic_roster(size, seed)
+        make_storage(backend).save(records)
+        numbers = list(records)
+        del records
+
+        manager = RoomManager(make_storage(backend))
+        results.append(summarize("load_data", [timed(manager.load_data) for _ in range(BILL_REPEATS)]))
+        results.append(summarize("save_data", [timed(manager.save_data) for _ in range(BILL_REPEATS)]))
+        results.append(summarize("calculate_bill", [
+            timed(manager.calculate_bill, rng.uniform(1000, 100000)) for _ in range(operations)
+        ]))
+
+        student_share, laptop_share, _ = manager.calculate_bill(10000)
+        results.append(summarize("apply_bill_to_rooms", [
+            timed(manager.apply_bill_to_rooms, student_share, laptop_share) for _ in range(BILL_REPEATS)
+        ]))
+        manager.flush()
+
+        results.append(summarize("update_room", [
+            timed(manager.update_room, rng.choice(numbers), name=f"اسم {i}", has_laptop=rng.randrange(4),
+                  no_laptop=rng.randrange(4))
+            for i in range(operations)
+        ]))
+        results.append(summarize("pay_room_bill", [
+            timed(manager.pay_room_bill, rng.choice(numbers), 0.01) for _ in range(operations)
+        ]))
+        manager.flush()
+        manager.storage.close()
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    peak = peak_memory_kb()
+    for result in results:
+        result.update({"backend": backend, "rooms": size, "peak_rss_kb": peak})
+    return results
+
+
+def run_all(sizes, backends, operations, seed):
+    # كل حجم في عملية مستقلة حتى تكون ذروة الذاكرة خاصة به
+    results = []
+    for backend in backends:
+        for size in sizes:
+            print(f"{backend}: {size} غرفة ...", file=sys.stderr)
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--single", str(size), "--backends", backend,
+                 "--operations", str(operations), "--seed", str(seed)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            results.extend(json.loads(output))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(previous_file, report):
+    # نسبة الزمن p50 الحالي إلى السابق لكل عملية، أكبر من 1 يعني أبطأ
+    with open(previous_file, 'r', encoding='utf-8') as f:
+        previous = {
+            (item["backend"], item["rooms"], item["operation"]): item for item in json.load(f)["results"]
+        }
+    for item in report["results"]:
+        old = previous.get((item["backend"], item["rooms"], item["operation"]))
+        if old and old["p50_ms"]:
+            ratio = item["p50_ms"] / old["p50_ms"]
+            print(f'{item["backend"]:>8} {item["rooms"]:>8} {item["operation"]:<20} '
+                  f'{old["p50_ms"]:10.3f} -> {item["p50_ms"]:10.3f} ms  x{ratio:.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="قياس أداء عمليات مدير الغرف على بيانات مولدة")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--backends", default="json", help="أنواع التخزين مفصولة بفواصل")
+    parser.add_argument("--operations", type=int, default=DEFAULT_OPERATIONS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="ملف نتائج سابق للمقارنة")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        json.dump(run_single(args.single, args.backends, args.operations, args.seed), sys.stdout)
+        return
+
+    output = os.path.abspath(args.output)
+    report = {
+        "generated_at": datetime.now().isoformat(timespec='seconds'),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": run_all([int(size) for size in args.sizes.split(",")], args.backends.split(","),
+                           args.operations, args.seed),
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"النتائج في {output}", file=sys.stderr)
+
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import csv
+import json
+import math
+import os
+
+# حجم القطعة المقروءة من ملفات JSON في كل مرة
+READ_CHUNK_SIZE = 64 * 1024
+
+# أعمدة ملف المدفوعات بالترتيب
+PAYMENT_COLUMNS = ("room", "amount")
+
+# أعمدة ملف الغرف بالترتيب، عمود المبلغ اختياري عند الاستيراد
+ROSTER_COLUMNS = ("room", "name", "has_laptop", "no_laptop", "balance")
+
+
+def file_format(filename):
+    # الصيغة تحدد من امتداد الملف، وأي امتداد آخر يعامل كـ CSV
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in (".json", ".jsonl"):
+        return extension[1:]
+    return "csv"
+
+
+def iter_json_array(f, chunk_size=READ_CHUNK_SIZE):
+    # قراءة عناصر مصفوفة JSON واحداً تلو الآخر بدون تحميل الملف كاملاً
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    eof = False
+
+    while True:
+        # تجاوز المسافات والفواصل بين العناصر
+        while position < len(buffer) and (buffer[position].isspace() or (started and buffer[position] == ",")):
+            position += 1
+
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError("ملف JSON يجب أن يحتوي مصفوفة")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                end = None
+            # العنصر قد يكون مقطوعاً في نهاية القطعة الحالية (مثل رقم لم يكتمل)
+            if end is not None and (end < len(buffer) or eof):
+                yield value
+                position = end
+                continue
+            if eof:
+                raise ValueError("عنصر JSON غير صالح")
+        elif eof:
+            raise ValueError("ملف JSON غير مكتمل")
+
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def row_values(row, columns):
+    # الصف في JSON قد يكون قائمة بترتيب الأعمدة أو كائناً بأسمائها
+    if isinstance(row, dict):
+        return [row.get(column) for column in columns]
+    if isinstance(row, (list, tuple)):
+        return list(row)
+    raise ValueError("صف غير صالح")
+
+
+def parse_roster_row(values):
+    # يعيد (رقم الغرفة، [الاسم، مع لابتوب، بدون لابتوب، المبلغ]) والمبلغ None إذا لم يحدد
+    if not values or len(values) < 4:
+        raise ValueError('صف غير مكتمل')
+    room_num = str(values[0] if values[0] is not None else "").strip()
+    name = str(values[1] if values[1] is not None else "").strip()
+    if not room_num:
+        raise ValueError('رقم الغرفة مطلوب')
+    if not name:
+        raise ValueError('اسم المسؤول مطلوب')
+    try:
+        has_laptop = int(values[2])
+        no_laptop = int(values[3])
+    except (ValueError, TypeError):
+        raise ValueError('قيم الطلاب يجب أن تكون أرقاماً')
+    if has_laptop < 0 or no_laptop < 0:
+        raise ValueError('عدد الطلاب لا يمكن أن يكون سالباً')
+
+    balance = values[4] if len(values) > 4 else None
+    if balance is not None and str(balance).strip() != "":
+        try:
+            balance = float(balance)
+        except (ValueError, TypeError):
+            raise ValueError('قيمة المبلغ يجب أن تكون رقمية')
+        if not math.isfinite(balance):
+            raise ValueError('قيمة المبلغ يجب أن تكون رقمية')
+        if balance < 0:
+            raise ValueError('المبلغ لا يمكن أن يكون سالباً')
+    else:
+        balance = None
+    return room_num, [name, has_laptop, no_laptop, balance]
+
+
+def read_rows(filename, columns):
+    # يعيد (رقم الصف، القيم) لكل صف في الملف بدون قراءة الملف كاملاً في الذاكرة
+    file_type = file_format(filename)
+    with open(filename, 'r', encoding='utf-8-sig', newline='') as f:
+        if file_type == "csv":
+            reader = csv.reader(f)
+            for values in reader:
+                if not values or not any(value.strip() for value in values):
+                    continue
+                # تجاوز سطر العناوين إن وجد
+                if reader.line_num == 1 and values[0].strip().lower() == columns[0]:
+                    continue
+                yield reader.line_num, values
+        elif file_type == "jsonl":
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, row_values(json.loads(line), columns)
+                except ValueError:
+                    yield line_number, None
+        else:
+            for row_number, row in enumerate(iter_json_array(f), 1):
+                try:
+                    yield row_number, row_values(row, columns)
+                except ValueError:
+                    yield row_number, None
+
+
+def write_rows(filename, columns, rows):
+    # كتابة الصفوف واحداً تلو الآخر في ملف مؤقت ثم استبدال الملف دفعة واحدة
+    file_type = file_format(filename)
+    temp_file = filename + ".tmp"
+    count = 0
+    with open(temp_file, 'w', encoding='utf-8', newline='') as f:
+        if file_type == "csv":
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        elif file_type == "jsonl":
+            for row in rows:
+                f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+                count += 1
+        else:
+            f.write("[")
+            for row in rows:
+                f.write(("," if count else "") + "\n" + json.dumps(dict(zip(columns, row)), ensure_ascii=False))
+                count += 1
+            f.write("\n]\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, filename)
+    return count
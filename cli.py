@@ -0,0 +1,307 @@
+import argparse
+import json
+import shlex
+import sys
+
+from invoices import InvoiceRenderer, export_invoices
+from room_manager import RoomManager
+from room_table import building_of
+from storage import make_storage
+
+# تشغيل عمليات الفواتير بدون الواجهة، كل نتيجة تكتب كسطر JSON مستقل في المخرجات
+# أمثلة:
+#   python cli.py calculate 12000
+#   python cli.py preview 12000 --building 2
+#   python cli.py compare 12000 15000 2:4000 --ratio 30 --ratio 50 --ratio 70
+#   python cli.py apply 12000 --invoices فواتير.zip
+#   python cli.py pay 13 150
+#   python cli.py pay --file مدفوعات.csv
+#   python cli.py batch أوامر.txt
+
+
+def emit(record):
+    sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def failure(command, message, **fields):
+    return {"command": command, "ok": False, "error": message, **fields}
+
+
+def bill_shares(manager, command, bill_amount):
+    # يعيد (حصة الطالب، حصة اللابتوب، None) أو (None، None، سطر الخطأ)
+    student_share, laptop_share, error = manager.calculate_bill(bill_amount)
+    if error:
+        return None, None, failure(command, error)
+    return student_share, laptop_share, None
+
+
+def calculate(manager, args):
+    student_share, laptop_share, error = bill_shares(manager, "calculate", args.amount)
+    if error:
+        yield error
+        return
+    rooms = manager.rooms
+    yield {
+        "command": "calculate",
+        "ok": True,
+        "bill_amount": float(args.amount),
+        "student_share": student_share,
+        "laptop_share": laptop_share,
+        "total_students": rooms.total_students(),
+        "total_with_laptop": rooms.total_with_laptop(),
+    }
+
+
+def preview(manager, args):
+    # سطر لكل غرفة بحصتها من الفاتورة بدون تعديل أي شيء، ثم سطر بالمجموع
+    student_share, laptop_share, error = bill_shares(manager, "preview", args.amount)
+    if error:
+        yield error
+        return
+    with manager.lock:
+        rooms = manager.rooms
+        share_all, share_laptop, totals = rooms.bill_breakdown(student_share, laptop_share)
+        columns = zip(rooms.numbers, rooms.names, rooms.has_laptop, rooms.no_laptop, rooms.balance)
+    count = 0
+    bill_total = 0.0
+    for (room_num, name, has_laptop, no_laptop, balance), room_share_all, room_share_laptop, total in zip(
+        columns, share_all, share_laptop, totals
+    ):
+        if args.building and building_of(room_num) != args.building:
+            continue
+        count += 1
+        bill_total += total
+        yield {
+            "command": "preview",
+            "room": room_num,
+            "name": name,
+            "has_laptop": has_laptop,
+            "no_laptop": no_laptop,
+            "share_all": round(room_share_all, 2),
+            "share_laptop": round(room_share_laptop, 2),
+            "total": round(total, 2),
+            "new_balance": round(balance + total, 2),
+        }
+    yield {
+        "command": "preview",
+        "ok": True,
+        "bill_amount": float(args.amount),
+        "student_share": student_share,
+        "laptop_share": laptop_share,
+        "rooms": count,
+        "total": round(bill_total, 2),
+    }
+
+
+def compare(manager, args):
+    # سطر لكل غرفة بحصتها في كل سيناريو بترتيب السيناريوهات، ثم سطر ملخص لكل سيناريو
+    matrix, error = manager.compare_bills(args.amounts, args.ratio)
+    if error:
+        yield failure("compare", error)
+        return
+    labels = [scenario.label for scenario in matrix.scenarios]
+    for room_num, charges in matrix.rows():
+        yield {"command": "compare", "room": room_num, "charges": [round(charge, 2) for charge in charges]}
+    for summary in matrix.summary():
+        yield {"command": "compare", **summary, "total": round(summary["total"], 2),
+               "max_room": round(summary["max_room"], 2)}
+    yield {"command": "compare", "ok": True, "scenarios": labels, "rooms": len(matrix)}
+
+
+def invoice_jobs(manager, student_share, laptop_share):
+    with manager.lock:
+        rooms = manager.rooms
+        totals = rooms.bill_breakdown(student_share, laptop_share)[2]
+        return [
+            (room_num, room.to_record(), room.version, total)
+            for (room_num, room), total in zip(rooms.items(), totals)
+        ]
+
+
+def apply(manager, args):
+    student_share, laptop_share, error = bill_shares(manager, "apply", args.amount)
+    if error:
+        yield error
+        return
+    # الفواتير تولد قبل التطبيق لأنها تعرض الرصيد الجديد من الرصيد الحالي
+    if args.invoices:
+        jobs = invoice_jobs(manager, student_share, laptop_share)
+        try:
+            export_invoices(args.invoices, jobs, float(args.amount), student_share, laptop_share, InvoiceRenderer())
+        except OSError:
+            yield failure("apply", 'حدث خطأ أثناء تصدير الفواتير')
+            return
+    manager.apply_bill_to_rooms(student_share, laptop_share)
+    yield {
+        "command": "apply",
+        "ok": True,
+        "bill_amount": float(args.amount),
+        "student_share": student_share,
+        "laptop_share": laptop_share,
+        "rooms": len(manager.rooms),
+        "total_balance": round(manager.rooms.total_balance(), 2),
+        "invoices": args.invoices,
+    }
+
+
+def pay(manager, args):
+    if args.file:
+        applied, errors = manager.import_payments(args.file)
+        for row_number, message in errors:
+            yield failure("pay", message, row=row_number)
+        yield {"command": "pay", "ok": not errors, "file": args.file, "applied": applied, "rejected": len(errors)}
+        return
+    if args.room is None or args.amount is None:
+        yield failure("pay", 'يرجى تحديد رقم الغرفة والمبلغ أو ملف المدفوعات')
+        return
+    success, message, _ = manager.pay_room_bill(args.room, args.amount)
+    result = {"command": "pay", "ok": success, "room": args.room}
+    if success:
+        result.update(message=message, balance=round(manager.rooms[args.room].balance, 2))
+    else:
+        result["error"] = message
+    yield result
+
+
+def reset(manager, args):
+    success, message = manager.reset_room_bill(args.room)
+    yield {"command": "reset", "ok": success, "room": args.room, ("message" if success else "error"): message}
+
+
+def undo(manager, args):
+    # التاريخ في الذاكرة فقط، فالتراجع يفيد داخل أوامر الدفعة الواحدة
+    success, message = manager.undo() if args.command == "undo" else manager.redo()
+    yield {"command": args.command, "ok": success, ("message" if success else "error"): message}
+
+
+def export(manager, args):
+    # قائمة الغرف (CSV أو JSON حسب الامتداد)، أو فواتير كل الغرف في ملف ZIP إذا حددت قيمة الفاتورة
+    if args.bill is not None:
+        student_share, laptop_share, error = bill_shares(manager, "export", args.bill)
+        if error:
+            yield error
+            return
+        jobs = invoice_jobs(manager, student_share, laptop_share)
+        try:
+            export_invoices(args.filename, jobs, float(args.bill), student_share, laptop_share, InvoiceRenderer())
+        except OSError:
+            yield failure("export", 'حدث خطأ أثناء تصدير الفواتير')
+            return
+        yield {"command": "export", "ok": True, "file": args.filename, "invoices": len(jobs)}
+        return
+    try:
+        count = manager.export_roster(args.filename)
+    except OSError:
+        yield failure("export", 'حدث خطأ أثناء تصدير قائمة الغرف')
+        return
+    yield {"command": "export", "ok": True, "file": args.filename, "rooms": count}
+
+
+def batch(manager, args):
+    # كل سطر أمر كامل بنفس صيغة سطر الأوامر، وكلها تنفذ على نفس البيانات المحملة مرة واحدة
+    parser = build_parser(in_batch=True)
+    source = open(args.filename, 'r', encoding='utf-8') if args.filename != "-" else sys.stdin
+    try:
+        for line_number, line in enumerate(source, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                command_args = parser.parse_args(shlex.split(line))
+            except (ValueError, SystemExit):
+                yield failure("batch", 'أمر غير صالح', line=line_number)
+                continue
+            for record in command_args.handler(manager, command_args):
+                yield {**record, "line": line_number}
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+class BatchArgumentParser(argparse.ArgumentParser):
+    # داخل الدفعة الأمر الخاطئ يسجل كسطر خطأ بدلاً من إيقاف البرنامج
+    def error(self, message):
+        raise ValueError(message)
+
+
+def build_parser(in_batch=False):
+    parser_class = BatchArgumentParser if in_batch else argparse.ArgumentParser
+    parser = parser_class(prog="cli.py", description="تشغيل عمليات الفواتير بدون الواجهة، المخرجات أسطر JSON")
+    if not in_batch:
+        parser.add_argument("--storage", help="نوع التخزين، الافتراضي من ROOMS_STORAGE")
+    commands = parser.add_subparsers(dest="command", required=True, parser_class=parser_class)
+
+    command = commands.add_parser("calculate", help="حساب حصة الطالب وحصة اللابتوب")
+    command.add_argument("amount")
+    command.set_defaults(handler=calculate)
+
+    command = commands.add_parser("preview", help="حصة كل غرفة من الفاتورة بدون تطبيقها")
+    command.add_argument("amount")
+    command.add_argument("--building", help="غرف مبنى واحد فقط")
+    command.set_defaults(handler=preview)
+
+    command = commands.add_parser("compare", help="مقارنة حصص الغرف في عدة فواتير ونسب توزيع بدون تطبيقها")
+    command.add_argument("amounts", nargs="+", help="قيم الفواتير، و\"مبنى:مبلغ\" لفاتورة مبنى واحد")
+    command.add_argument("--ratio", action="append", help="نسبة الجزء الموزع على جميع الطلاب، تكرر لعدة نسب")
+    command.set_defaults(handler=compare)
+
+    command = commands.add_parser("apply", help="تطبيق الفاتورة على كل الغرف")
+    command.add_argument("amount")
+    command.add_argument("--invoices", help="ملف ZIP تحفظ فيه فواتير الغرف قبل التطبيق")
+    command.set_defaults(handler=apply)
+
+    command = commands.add_parser("pay", help="سداد مبلغ لغرفة أو استيراد ملف مدفوعات")
+    command.add_argument("room", nargs="?")
+    command.add_argument("amount", nargs="?")
+    command.add_argument("--file", help="ملف مدفوعات CSV أو JSON")
+    command.set_defaults(handler=pay)
+
+    command = commands.add_parser("reset", help="تصفير المبلغ المتراكم لغرفة")
+    command.add_argument("room")
+    command.set_defaults(handler=reset)
+
+    command = commands.add_parser("undo", help="التراجع عن آخر فاتورة أو سداد أو تصفير في نفس الدفعة")
+    command.set_defaults(handler=undo)
+
+    command = commands.add_parser("redo", help="إعادة آخر عملية تم التراجع عنها")
+    command.set_defaults(handler=undo)
+
+    command = commands.add_parser("export", help="تصدير قائمة الغرف أو الفواتير")
+    command.add_argument("filename")
+    command.add_argument("--bill", help="قيمة الفاتورة لتصدير فواتير كل الغرف بدلاً من القائمة")
+    command.set_defaults(handler=export)
+
+    if not in_batch:
+        command = commands.add_parser("batch", help="تنفيذ أوامر من ملف، سطر لكل أمر (- للمدخلات)")
+        command.add_argument("filename", nargs="?", default="-")
+        command.set_defaults(handler=batch)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        manager = RoomManager(make_storage(args.storage) if args.storage else None)
+    except ValueError as e:
+        # ملف بيانات تالف، يترك كما هو حتى يستعاد
+        emit(failure("load", str(e)))
+        sys.stdout.flush()
+        return 1
+
+    ok = True
+    try:
+        for record in args.handler(manager, args):
+            ok = ok and record.get("ok", True)
+            emit(record)
+    finally:
+        # كل التعديلات تحفظ مرة واحدة في النهاية، والخروج بخطأ إذا لم يكتمل الحفظ
+        if not manager.flush():
+            emit(failure("save", 'لم يكتمل حفظ التعديلات'))
+            ok = False
+        manager.storage.close()
+        sys.stdout.flush()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
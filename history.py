@@ -0,0 +1,88 @@
+import os
+from array import array
+from collections import deque
+from operator import eq
+
+# عدد العمليات التي يمكن التراجع عنها، الأقدم يحذف أولاً عند تجاوزه
+HISTORY_DEPTH = int(os.environ.get("ROOMS_HISTORY_DEPTH", "20"))
+
+# أقصى عدد جلسات يحفظ تاريخها، وتاريخ الجلسة الأقدم استخداماً يحذف عند تجاوزه
+HISTORY_SESSIONS = int(os.environ.get("ROOMS_HISTORY_SESSIONS", "32"))
+
+
+def unchanged(numbers, balances, balance_of):
+    # هل الأرصدة الحالية لكل الغرف كما حفظت
+    return all(map(eq, map(balance_of, numbers), balances))
+
+
+class Step:
+    # عملية واحدة: الغرف التي عدلتها وأرصدتها قبل العملية وبعدها بنفس الترتيب
+    __slots__ = ("label", "kind", "numbers", "before", "after")
+
+    def __init__(self, label, kind, numbers, before, after):
+        self.label = label
+        self.kind = kind
+        self.numbers = numbers
+        self.before = before
+        self.after = after
+
+
+class History:
+    # تاريخ عمليات جلسة واحدة للتراجع عنها وإعادتها، والتراجع يعدل غرف العملية فقط
+    # ويرفض إذا تغير رصيد إحداها بعد العملية من جلسة أخرى حتى لا يلغي تعديلها
+    def __init__(self, depth=HISTORY_DEPTH):
+        self.depth = depth
+        self.clear()
+
+    def clear(self):
+        self.pending = {}
+        self.undo_stack = deque(maxlen=self.depth)
+        self.redo_stack = []
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def track(self, balances):
+        # أرصدة الغرف التي ستتغير قبل التغيير، balances أزواج (رقم الغرفة، المبلغ)
+        # والغرفة التي تتغير أكثر من مرة في نفس العملية يحفظ رصيدها الأول
+        if not self.depth:
+            return
+        if not self.pending:
+            self.pending = dict(balances)
+            return
+        for room_num, balance in balances:
+            self.pending.setdefault(room_num, balance)
+
+    def record(self, label, kind, balances):
+        # حفظ عملية بعد تنفيذها بأرصدة الغرف التي تغيرت، والعمليات المتراجع عنها لا يمكن إعادتها بعدها
+        if not self.depth:
+            return
+        balances = dict(balances)
+        numbers = list(balances)
+        before = array('d', map(self.pending.__getitem__, numbers))
+        self.pending = {}
+        self.undo_stack.append(Step(label, kind, numbers, before, array('d', balances.values())))
+        self.redo_stack.clear()
+
+    def undo(self, balance_of):
+        # يعيد (وصف العملية، نوعها، {رقم الغرفة: المبلغ المطلوب}) أو None إذا لم يوجد ما يتراجع عنه
+        # أو False إذا تغير رصيد غرفة من العملية بعدها، balance_of(رقم الغرفة) يعيد رصيدها الحالي
+        if not self.undo_stack:
+            return None
+        step = self.undo_stack[-1]
+        if not unchanged(step.numbers, step.after, balance_of):
+            return False
+        self.redo_stack.append(self.undo_stack.pop())
+        return step.label, step.kind, dict(zip(step.numbers, step.before))
+
+    def redo(self, balance_of):
+        if not self.redo_stack:
+            return None
+        step = self.redo_stack[-1]
+        if not unchanged(step.numbers, step.before, balance_of):
+            return False
+        self.undo_stack.append(self.redo_stack.pop())
+        return step.label, step.kind, dict(zip(step.numbers, step.after))
@@ -0,0 +1,130 @@
+import atexit
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+
+# القياس يعمل فقط إذا كان ROOMS_METRICS=1، وبدونه تبقى الدوال كما هي بدون أي تغليف
+ENABLED = os.environ.get("ROOMS_METRICS") == "1"
+
+# ملف تحفظ فيه القياسات عند الخروج إذا حدد
+METRICS_FILE = os.environ.get("ROOMS_METRICS_FILE")
+
+# عدد خانات المدرج، الخانة i تحتوي الاستدعاءات التي استغرقت أقل من 2^i ميكروثانية
+HISTOGRAM_BUCKETS = 32
+
+
+class Histogram:
+    __slots__ = ("count", "total", "minimum", "maximum", "bytes", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+        self.bytes = 0
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+
+    def add(self, seconds, nbytes=0):
+        self.count += 1
+        self.total += seconds
+        self.minimum = seconds if self.minimum is None else min(self.minimum, seconds)
+        self.maximum = max(self.maximum, seconds)
+        self.bytes += nbytes
+        self.buckets[min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def percentile(self, p):
+        # الحد الأعلى للخانة التي تقع فيها النسبة المطلوبة بالمللي ثانية
+        target = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return min((1 << i) / 1000, self.maximum * 1000)
+        return self.maximum * 1000
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "min_ms": (self.minimum or 0.0) * 1000,
+            "max_ms": self.maximum * 1000,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "bytes_written": self.bytes,
+            "buckets_us": {str(1 << i): count for i, count in enumerate(self.buckets) if count},
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started_at = datetime.now()
+
+    def record(self, name, seconds, nbytes=0):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds, nbytes)
+
+    def add_bytes(self, nbytes):
+        # البايتات المكتوبة تحسب للعملية المقاسة الجارية في نفس الخيط
+        self.local.bytes = getattr(self.local, "bytes", 0) + nbytes
+
+    def thread_bytes(self):
+        return getattr(self.local, "bytes", 0)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "started_at": self.started_at.isoformat(timespec='seconds'),
+                "generated_at": datetime.now().isoformat(timespec='seconds'),
+                "operations": {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())},
+            }
+
+    def dump(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        return filename
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.started_at = datetime.now()
+
+
+metrics = Metrics()
+
+
+def timed(name):
+    # مزخرف يسجل زمن كل استدعاء وعدد البايتات المكتوبة أثناءه، ولا يغير الدالة إذا كان القياس معطلاً
+    def decorator(function):
+        if not ENABLED:
+            return function
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start_bytes = metrics.thread_bytes()
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics.record(name, time.perf_counter() - start, metrics.thread_bytes() - start_bytes)
+        return wrapper
+    return decorator
+
+
+def bytes_written(nbytes):
+    if ENABLED:
+        metrics.add_bytes(nbytes)
+
+
+if ENABLED and METRICS_FILE:
+    atexit.register(metrics.dump, METRICS_FILE)
@@ -0,0 +1,204 @@
+import json
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from string import Formatter
+
+from room_table import building_of
+
+# عدد العمال المستخدمين في توليد الفواتير دفعة واحدة
+INVOICE_WORKERS = 4
+
+# عدد الفواتير الجاهزة المحفوظة في الذاكرة، الأقدم استخداماً يحذف أولاً
+INVOICE_CACHE_SIZE = 4096
+
+# قالب الفاتورة، الحقول الثابتة لكل مبنى تستبدل مرة واحدة عند التشغيل
+INVOICE_TEMPLATE = """
+{header}
+
+{title}
+قيمة الفاتورة الكلية: {bill_amount:.2f}
+المبلغ على جميع الطلاب: {student_share:.2f} للطالب
+المبلغ الإضافي على حاملي اللابتوب: {laptop_share:.2f} للطالب
+
+────────────────────
+
+حصة الغرفة:
+اسم المسؤول: {name}
+رقم الغرفة: {room_num}
+عدد الطلاب الكلي: {total_students}
+عدد الطلاب بدون لابتوب: {no_laptop}
+عدد الطلاب مع لابتوب: {has_laptop}
+
+طلاب بدون لابتوب:
+- نصيب الفرد: {student_share:.2f}
+- العدد: {no_laptop}
+- الإجمالي: {cost_without_laptop:.2f}
+
+طلاب مع لابتوب:
+- نصيب الفرد: {laptop_student_share:.2f}
+- العدد: {has_laptop}
+- الإجمالي: {cost_with_laptop:.2f}
+
+إجمالي هذه الفاتورة: {total_cost:.2f}
+المبلغ المتبقي من فواتير سابقة: {previous_bill:.2f}
+المبلغ الإجمالي على الغرفة: {new_total_bill:.2f}
+
+────────────────────
+
+ملاحظات:
+• مهلة السداد: {due_days} أيام من تاريخ صدور الفاتورة
+• آخر موعد للسداد: {due_date}
+• يمكنكم التسديد على الحساب البنكي:
+  البنك: {bank}
+  رقم الحساب: {account_number}
+  اسم الحساب: {account_name}
+
+تاريخ الإصدار: {issue_date}
+"""
+
+# إعدادات الفاتورة لكل مبنى، المفتاح هو رقم المبنى وما لا يحدد يؤخذ من default
+INVOICE_SETTINGS = {
+    "default": {
+        "template": INVOICE_TEMPLATE,
+        "header": "بيت الطالب",
+        "title": "فاتورة الكهرباء",
+        "due_days": 3,
+        "bank": "الكريمي",
+        "account_number": "3170319515",
+        "account_name": "همدان فارس",
+    },
+}
+
+
+def compile_template(template, settings):
+    # استبدال الحقول الثابتة وإبقاء حقول الفاتورة فقط ليعبأ القالب بعدها بـ format_map
+    parts = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        parts.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+        if field in settings:
+            parts.append(format(settings[field], spec).replace("{", "{{").replace("}", "}}"))
+        else:
+            parts.append("{" + field + ("!" + conversion if conversion else "") + (":" + spec if spec else "") + "}")
+    return "".join(parts)
+
+
+class InvoiceRenderer:
+    def __init__(self, settings=None, cache_size=INVOICE_CACHE_SIZE):
+        self.settings = settings or INVOICE_SETTINGS
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.keys_by_room = {}
+        self.lock = threading.Lock()
+
+        # تجهيز قوالب كل المباني مرة واحدة
+        self.templates = {}
+        for building in self.settings:
+            self.template_for(building)
+
+    def template_for(self, building):
+        compiled = self.templates.get(building)
+        if compiled is None:
+            settings = dict(self.settings["default"])
+            settings.update(self.settings.get(building, {}))
+            compiled = (compile_template(settings["template"], settings), settings["due_days"])
+            self.templates[building] = compiled
+        return compiled
+
+    def render(self, room_num, record, version, bill_amount, student_share, laptop_share, total_cost, current_date=None):
+        # record بصيغة القرص: [الاسم، مع لابتوب، بدون لابتوب، المبلغ المتراكم]
+        current_date = current_date or datetime.now()
+        issue_date = current_date.strftime('%Y-%m-%d')
+        key = (room_num, version, bill_amount, student_share, laptop_share, issue_date)
+
+        with self.lock:
+            content = self.cache.get(key)
+            if content is not None:
+                self.cache.move_to_end(key)
+                return content
+
+        template, due_days = self.template_for(building_of(room_num))
+        name, has_laptop, no_laptop, previous_bill = record
+        content = template.format_map({
+            "bill_amount": bill_amount,
+            "student_share": student_share,
+            "laptop_share": laptop_share,
+            "name": name,
+            "room_num": room_num,
+            "total_students": has_laptop + no_laptop,
+            "no_laptop": no_laptop,
+            "has_laptop": has_laptop,
+            "cost_without_laptop": no_laptop * student_share,
+            "laptop_student_share": student_share + laptop_share,
+            "cost_with_laptop": has_laptop * (student_share + laptop_share),
+            "total_cost": total_cost,
+            "previous_bill": previous_bill,
+            "new_total_bill": previous_bill + total_cost,
+            "due_date": (current_date + timedelta(days=due_days)).strftime('%Y-%m-%d'),
+            "issue_date": issue_date,
+        })
+
+        with self.lock:
+            self.cache[key] = content
+            self.keys_by_room.setdefault(room_num, set()).add(key)
+            while len(self.cache) > self.cache_size:
+                old_key, _ = self.cache.popitem(last=False)
+                room_keys = self.keys_by_room.get(old_key[0])
+                if room_keys is not None:
+                    room_keys.discard(old_key)
+                    if not room_keys:
+                        del self.keys_by_room[old_key[0]]
+        return content
+
+    def invalidate(self, room_num=None):
+        # room_num = None يحذف كل الفواتير المحفوظة
+        with self.lock:
+            if room_num is None:
+                self.cache.clear()
+                self.keys_by_room.clear()
+                return
+            for key in self.keys_by_room.pop(room_num, ()):
+                self.cache.pop(key, None)
+
+
+def export_invoices(filename, jobs, bill_amount, student_share, laptop_share, renderer, progress=None,
+                    workers=INVOICE_WORKERS):
+    # jobs: قائمة (رقم الغرفة، سجل الغرفة، نسخة البيانات، إجمالي الفاتورة) تؤخذ قبل التوليد
+    current_date = datetime.now()
+    total = len(jobs)
+    manifest = {
+        "generated_at": current_date.isoformat(timespec='seconds'),
+        "bill_amount": bill_amount,
+        "student_share": student_share,
+        "laptop_share": laptop_share,
+        "invoices": []
+    }
+
+    def render(job):
+        room_num, record, version, total_cost = job
+        return renderer.render(room_num, record, version, bill_amount, student_share, laptop_share, total_cost,
+                               current_date)
+
+    with zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED) as archive, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        # كتابة كل فاتورة في الأرشيف بمجرد توليدها وبنفس ترتيب الغرف
+        for done, (job, content) in enumerate(zip(jobs, executor.map(render, jobs)), 1):
+            room_num, record, version, total_cost = job
+            entry = f"فاتورة_الغرفة_{room_num}.txt"
+            archive.writestr(entry, content)
+            manifest["invoices"].append({
+                "room": room_num,
+                "name": record[0],
+                "file": entry,
+                "total": round(total_cost, 2),
+                "new_balance": round(record[3] + total_cost, 2)
+            })
+            if progress:
+                progress(done, total)
+
+        archive.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+    return filename
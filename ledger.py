@@ -0,0 +1,133 @@
+import time
+from array import array
+from bisect import bisect_right
+
+# أنواع القيود في السجل، المبلغ موجب للإضافة وسالب للخصم من رصيد الغرفة
+CHARGE = "charge"
+PAYMENT = "payment"
+RESET = "reset"
+OPENING = "opening"
+ADJUST = "adjust"
+
+
+class LedgerSeries:
+    # قيود غرفة واحدة مرتبة زمنياً مع المجاميع التراكمية بجانبها
+    # الرصيد الافتتاحي يحفظ منفصلاً ويضاف عند القراءة، فإضافته لا تعيد كتابة الأرصدة التراكمية
+    __slots__ = ("times", "balances", "payments", "opening")
+
+    def __init__(self):
+        self.times = array('d')
+        self.balances = array('d')
+        self.payments = array('d')
+        self.opening = 0.0
+
+    def append(self, at, amount, kind):
+        last_balance = self.balances[-1] if self.balances else 0.0
+        last_paid = self.payments[-1] if self.payments else 0.0
+        self.times.append(at)
+        self.balances.append(last_balance + amount)
+        self.payments.append(last_paid - amount if kind == PAYMENT else last_paid)
+
+    def add_opening(self, amount):
+        # الرصيد الافتتاحي يسبق كل القيود، فيضاف قيد بتاريخ صفر مرة واحدة ليبدأ منه الرصيد
+        if not self.times or self.times[0] > 0.0:
+            self.times.insert(0, 0.0)
+            self.balances.insert(0, 0.0)
+            self.payments.insert(0, 0.0)
+        self.opening += amount
+
+    def balance_as_of(self, at):
+        i = bisect_right(self.times, at)
+        return self.balances[i - 1] + self.opening if i else 0.0
+
+    def paid_until(self, at):
+        i = bisect_right(self.times, at)
+        return self.payments[i - 1] if i else 0.0
+
+    def current_balance(self):
+        return self.balances[-1] + self.opening if self.balances else 0.0
+
+
+class Ledger:
+    # سجل إضافي فقط بكل المبالغ المضافة والمسددة، لكل غرفة وللمجموع الكلي
+    def __init__(self):
+        self.rooms = {}
+        self.total = LedgerSeries()
+        self.last_time = 0.0
+
+    def _time(self, at=None):
+        # الوقت لا يرجع للخلف حتى يبقى السجل مرتباً
+        at = time.time() if at is None else at
+        if at < self.last_time:
+            at = self.last_time
+        self.last_time = at
+        return at
+
+    def _series(self, room_num):
+        series = self.rooms.get(room_num)
+        if series is None:
+            series = self.rooms[room_num] = LedgerSeries()
+        return series
+
+    def add(self, room_num, kind, amount, at=None):
+        at = self._time(at)
+        self._series(room_num).append(at, amount, kind)
+        self.total.append(at, amount, kind)
+        return (at, room_num, kind, amount)
+
+    def add_bill(self, numbers, totals, at=None):
+        # قيد لكل غرفة وقيد واحد في المجموع الكلي
+        at = self._time(at)
+        entries = []
+        for room_num, amount in zip(numbers, totals):
+            if amount:
+                self._series(room_num).append(at, amount, CHARGE)
+                entries.append((at, room_num, CHARGE, amount))
+        self.total.append(at, sum(totals), CHARGE)
+        return entries
+
+    def load(self, entries):
+        # إعادة بناء السجل من القيود المحفوظة بترتيب كتابتها
+        opening = 0.0
+        for at, room_num, kind, amount in entries:
+            if kind == OPENING:
+                self._series(room_num).add_opening(amount)
+                opening += amount
+                continue
+            at = self._time(at)
+            self._series(room_num).append(at, amount, kind)
+            self.total.append(at, amount, kind)
+        if opening:
+            self.total.add_opening(opening)
+
+    def reconcile(self, balances, opening=False):
+        # قيود تسوية للغرف التي لا يطابق رصيدها في السجل رصيدها الفعلي، والغرف التي ليس لها قيود
+        # تأخذ رصيداً افتتاحياً بتاريخ صفر إذا كان opening (بيانات موجودة قبل تفعيل السجل)
+        entries = []
+        opening_total = 0.0
+        for room_num, balance in balances:
+            series = self.rooms.get(room_num)
+            difference = balance - (series.current_balance() if series else 0.0)
+            if abs(difference) <= 1e-9:
+                continue
+            if opening and series is None:
+                self._series(room_num).add_opening(difference)
+                opening_total += difference
+                entries.append((0.0, room_num, OPENING, difference))
+            else:
+                entries.append(self.add(room_num, ADJUST, difference))
+        if opening_total:
+            self.total.add_opening(opening_total)
+        return entries
+
+    def balance_as_of(self, room_num, at):
+        # room_num = None يعني مجموع كل الغرف
+        series = self.total if room_num is None else self.rooms.get(room_num)
+        return series.balance_as_of(at) if series else 0.0
+
+    def payments_between(self, room_num, start, end):
+        # مجموع المبالغ المسددة بعد start وحتى end
+        series = self.total if room_num is None else self.rooms.get(room_num)
+        if not series:
+            return 0.0
+        return series.paid_until(end) - series.paid_until(start)
@@ -1,145 +1,50 @@
 import flet as ft
-import json
-import os
-from datetime import datetime, timedelta
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from bulk_io import write_rows
+from instrumentation import ENABLED as METRICS_ENABLED, metrics, timed
+from invoices import InvoiceRenderer, export_invoices
+from room_manager import get_room_manager
 
 # إعدادات النافذة
 WINDOW_WIDTH = 400
 WINDOW_HEIGHT = 600
 
-# بيانات الغرف الافتراضية
-DEFAULT_ROOMS = {
-    "1112": ["بدون اسم", 0, 0, 0],
-    "13": ["بدون اسم", 0, 0, 0],
-    "2122": ["بدون اسم", 0, 0, 0],
-    "23": ["بدون اسم", 0, 0, 0],
-    "31": ["بدون اسم", 0, 0, 0],
-    "32": ["بدون اسم", 0, 0, 0],
-    "33": ["بدون اسم", 0, 0, 0],
-    "41": ["بدون اسم", 0, 0, 0],
-    "42": ["بدون اسم", 0, 0, 0],
-    "43": ["بدون اسم", 0, 0, 0],
-}
-
 # كلمة المرور
 PASSWORD = "H033s"
 
-class RoomManager:
-    def __init__(self):
-        self.data_file = "rooms_data.json"
-        self.rooms = self.load_data()
-    
-    def load_data(self):
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return DEFAULT_ROOMS.copy()
-        return DEFAULT_ROOMS.copy()
-    
-    def save_data(self):
-        try:
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(self.rooms, f, ensure_ascii=False)
-            return True
-        except:
-            return False
-    
-    def calculate_bill(self, bill_amount):
-        try:
-            bill_amount = float(bill_amount)
-            
-            # حساب إجمالي عدد الطلاب
-            total_students = sum(room_data[1] + room_data[2] for room_data in self.rooms.values())
-            
-            # حساب إجمالي الطلاب الذين يمتلكون لابتوب
-            total_with_laptop = sum(room_data[1] for room_data in self.rooms.values())
-            
-            if total_students == 0:
-                return None, None, 'لا يوجد طلاب لإجراء الحساب'
-            
-            # نظام المتوسط المرجح
-            # 50% من الفاتورة توزع بالتساوي على جميع الطلاب
-            student_share = (bill_amount * 0.5) / total_students if total_students > 0 else 0
-            
-            # 50% من الفاتورة توزع على الطلاب الذين يمتلكون أجهزة فقط
-            laptop_share = (bill_amount * 0.5) / total_with_laptop if total_with_laptop > 0 else 0
-            
-            return student_share, laptop_share, None
-        except ValueError:
-            return None, None, 'قيمة الفاتورة يجب أن تكون رقمية'
-        except ZeroDivisionError:
-            return None, None, 'لا يمكن القسمة على صفر في الحساب'
-    
-    def apply_bill_to_rooms(self, student_share, laptop_share):
-        # تحديث المبالغ في الغرف بناءً على نظام المتوسط المرجح
-        for room_num in self.rooms:
-            room_data = self.rooms[room_num]
-            total_students_in_room = room_data[1] + room_data[2]
-            
-            # حساب حصة الغرفة من الجزء الموزع على جميع الطلاب
-            room_share_all = total_students_in_room * student_share
-            
-            # حساب حصة الغرفة من الجزء الموزع على أصحاب الأجهزة
-            room_share_laptop = room_data[1] * laptop_share
-            
-            # إضافة المبلغ الإجمالي للغرفة
-            total_room_share = room_share_all + room_share_laptop
-            room_data[3] += total_room_share
-        
-        self.save_data()
-        return True
-    
-    def update_room(self, room_num, name=None, has_laptop=None, no_laptop=None):
-        if room_num not in self.rooms:
-            return False, 'رقم الغرفة غير موجود'
-        
-        try:
-            if name is not None:
-                self.rooms[room_num][0] = name
-            if has_laptop is not None:
-                self.rooms[room_num][1] = int(has_laptop)
-            if no_laptop is not None:
-                self.rooms[room_num][2] = int(no_laptop)
-            
-            self.save_data()
-            return True, 'تم التحديث بنجاح'
-        except ValueError:
-            return False, 'قيم الطلاب يجب أن تكون أرقاماً'
-    
-    def reset_room_bill(self, room_num):
-        if room_num in self.rooms:
-            self.rooms[room_num][3] = 0
-            self.save_data()
-            return True, 'تم تصفير المبلغ للغرفة'
-        else:
-            return False, 'رقم الغرفة غير موجود'
-    
-    def pay_room_bill(self, room_num, amount):
-        if room_num not in self.rooms:
-            return False, 'رقم الغرفة غير موجود'
-        
-        try:
-            amount = float(amount)
-            if amount <= 0:
-                return False, 'المبلغ يجب أن يكون أكبر من الصفر'
-            
-            current_bill = self.rooms[room_num][3]
-            if amount > current_bill:
-                return False, 'المبلغ المسدد أكبر من المبلغ المتراكم'
-            
-            self.rooms[room_num][3] -= amount
-            self.save_data()
-            return True, f'تم سداد {amount:.2f} من المبلغ المتراكم'
-        except ValueError:
-            return False, 'قيمة المبلغ يجب أن تكون رقمية'
+# عدد بطاقات الغرف المبنية في كل صفحة من شاشة الغرف
+ROOMS_PAGE_SIZE = 20
+
+# عدد الشاشات المبنية التي تبقى في الذاكرة، الأقل استخداماً تحذف أولاً
+SCREEN_CACHE_SIZE = 4
+
+# عدد الغرف المقترحة تحت حقل البحث أثناء الكتابة
+SEARCH_SUGGESTIONS = 4
 
 class AppScreenManager:
     def __init__(self, page):
         self.page = page
-        self.room_manager = RoomManager()
+        self.room_manager = get_room_manager()
         self.current_screen = None
+        self.screens = OrderedDict()
+        
+        # النصوص المرتبطة بحقول الغرف: (رقم الغرفة، الحقل) -> [(النص، القالب)]
+        self.bindings = {}
+        self.room_manager.subscribe(self.on_room_changed)
+        
+        # قوالب الفواتير تجهز مرة واحدة والفواتير الجاهزة تحذف عند تغير بيانات غرفتها
+        self.invoice_renderer = InvoiceRenderer()
+        
+        # نافذة اختيار الملفات مشتركة بين كل الشاشات، والدالة المحفوظة تستقبل الملف المختار
+        self.file_picker = ft.FilePicker(on_result=self.on_file_picked)
+        self.file_picker_action = None
+        self.page.overlay.append(self.file_picker)
+        
+        # إلغاء الاشتراك في تغييرات الغرف وحذف تاريخ التراجع الخاص بالجلسة عند إغلاقها
+        self.page.on_close = lambda e: self.close_session()
         
         # إعدادات النافذة
         self.page.title = "نظام إدارة الغرف"
@@ -149,25 +54,74 @@ class AppScreenManager:
         self.page.window.resizable = False
         self.page.padding = 0
         
+    @timed("handler.show_screen")
     def show_screen(self, screen_name, *args):
-        self.page.clean()
-        
-        if screen_name == "login":
-            self.show_login_screen()
-        elif screen_name == "main":
-            self.show_main_screen()
-        elif screen_name == "bill":
-            self.show_bill_screen()
-        elif screen_name == "rooms":
-            self.show_rooms_screen()
-        elif screen_name == "edit":
-            self.show_edit_screen()
-        elif screen_name == "payment":
-            self.show_payment_screen()
+        self.page.controls.clear()
+        self.bindings.clear()
+        
+        # بناء الشاشة مرة واحدة فقط ثم إعادة استخدامها
+        screen = self.screens.pop(screen_name, None)
+        if screen is None:
+            screen = getattr(self, f"build_{screen_name}_screen")()
+        self.screens[screen_name] = screen
+        while len(self.screens) > SCREEN_CACHE_SIZE:
+            self.screens.popitem(last=False)
+        
+        # تحديث بيانات الشاشة فقط ثم إرسالها للواجهة في تحديث واحد
+        self.current_screen = screen_name
+        getattr(self, f"refresh_{screen_name}_screen")()
+        self.page.add(screen)
+    
+    def close_session(self):
+        self.room_manager.unsubscribe(self.on_room_changed)
+        self.room_manager.forget_session(self)
+    
+    def bind(self, room_num, field, control, template):
+        # ربط نص بحقل في غرفة بحيث يحدث وحده عند تغير الحقل
+        self.bindings.setdefault((room_num, field), []).append((control, template))
+        control.value = template.format(getattr(self.room_manager.rooms[room_num], field))
+        return control
+    
+    def unbind(self, controls):
+        for key in list(self.bindings):
+            bound = [item for item in self.bindings[key] if not any(item[0] is c for c in controls)]
+            if bound:
+                self.bindings[key] = bound
+            else:
+                del self.bindings[key]
+    
+    def pick_file(self, action, extensions):
+        self.file_picker_action = action
+        self.file_picker.pick_files(allowed_extensions=extensions)
     
-    def show_login_screen(self):
-        self.current_screen = "login"
+    def on_file_picked(self, e):
+        action, self.file_picker_action = self.file_picker_action, None
+        if action and e.files and e.files[0].path:
+            action(e.files[0].path)
+    
+    def on_room_changed(self, room_num, field, value):
+        # يستدعى من خيط الجلسة التي عدلت الغرفة بينما قد تعيد هذه الجلسة بناء الروابط،
+        # فيمر على نسخة منها حتى لا يتوقف التحديث بسبب تغير القاموس أثناء المرور عليه
+        self.invoice_renderer.invalidate(room_num)
+        
+        changed = False
+        if room_num is None:
+            for (bound_room, bound_field), bound in list(self.bindings.items()):
+                if bound_field == field:
+                    current = getattr(self.room_manager.rooms[bound_room], field)
+                    for control, template in list(bound):
+                        control.value = template.format(current)
+                        changed = True
+        else:
+            for control, template in list(self.bindings.get((room_num, field), ())):
+                control.value = template.format(value)
+                changed = True
         
+        # إرسال التغييرات كلها للواجهة في تحديث واحد
+        if changed:
+            self.page.update()
+    
+    def build_login_screen(self):
         # حاوية رئيسية
         main_container = ft.Container(
             width=WINDOW_WIDTH,
@@ -226,10 +180,13 @@ class AppScreenManager:
         ], spacing=30)
         
         main_container.content = content_column
-        self.page.add(main_container)
         
         # حفظ المرجع لحقل كلمة المرور
         self.password_input = content_column.controls[1].controls[2]
+        return main_container
+    
+    def refresh_login_screen(self):
+        self.password_input.value = ""
     
     def check_password(self, e):
         password = self.password_input.value.strip()
@@ -238,9 +195,7 @@ class AppScreenManager:
         else:
             self.show_alert("خطأ", "كلمة المرور غير صحيحة")
     
-    def show_main_screen(self):
-        self.current_screen = "main"
-        
+    def build_main_screen(self):
         main_container = ft.Container(
             width=WINDOW_WIDTH,
             height=WINDOW_HEIGHT,
@@ -259,7 +214,9 @@ class AppScreenManager:
                     text_align=ft.TextAlign.CENTER
                 ),
                 height=90,
-                alignment=ft.alignment.center
+                alignment=ft.alignment.center,
+                # شاشة القياسات مخفية، تفتح بالضغط المطول على العنوان عند تفعيل ROOMS_METRICS
+                on_long_press=(lambda e: self.show_screen("diagnostics")) if METRICS_ENABLED else None
             ),
             
             # الأزرار
@@ -268,18 +225,133 @@ class AppScreenManager:
                 self.create_main_button("عرض الغرف والطلاب", "rooms", "gray"),
                 self.create_main_button("تعديل معلومات الغرف", "edit", "gray"),
                 self.create_main_button("سداد الفاتورة", "payment", "gray"),
+                
+                # التراجع عن آخر فاتورة أو سداد أو تصفير وإعادته
+                ft.Row([
+                    ft.ElevatedButton(
+                        "تراجع",
+                        on_click=lambda e: self.undo_redo(self.room_manager.undo),
+                        style=ft.ButtonStyle(bgcolor="gray"),
+                        width=170
+                    ),
+                    ft.ElevatedButton(
+                        "إعادة",
+                        on_click=lambda e: self.undo_redo(self.room_manager.redo),
+                        style=ft.ButtonStyle(bgcolor="gray"),
+                        width=170
+                    )
+                ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                
                 self.create_main_button("خروج", "exit", "red", "white")
             ], spacing=20)
         ], spacing=20)
         
         main_container.content = content_column
-        self.page.add(main_container)
+        return main_container
+    
+    def refresh_main_screen(self):
+        pass
+    
+    def build_diagnostics_screen(self):
+        main_container = ft.Container(
+            width=WINDOW_WIDTH,
+            height=WINDOW_HEIGHT,
+            padding=20,
+            bgcolor="white"
+        )
+        
+        self.diagnostics_list = ft.ListView(spacing=5, expand=True)
+        
+        content_column = ft.Column([
+            # العنوان
+            ft.Container(
+                content=ft.Text(
+                    "قياسات الأداء",
+                    size=24,
+                    color="black",
+                    weight=ft.FontWeight.BOLD,
+                    text_align=ft.TextAlign.CENTER
+                ),
+                height=60,
+                alignment=ft.alignment.center
+            ),
+            
+            ft.Container(
+                content=self.diagnostics_list,
+                height=330,
+                border=ft.border.all(1, "gray"),
+                padding=10
+            ),
+            
+            ft.Row([
+                ft.ElevatedButton(
+                    "تحديث",
+                    on_click=lambda e: self.refresh_diagnostics_screen() or self.page.update(),
+                    style=ft.ButtonStyle(bgcolor="gray")
+                ),
+                ft.ElevatedButton(
+                    "حفظ في ملف",
+                    on_click=self.dump_metrics,
+                    style=ft.ButtonStyle(
+                        color="white",
+                        bgcolor="green"
+                    )
+                ),
+                ft.ElevatedButton(
+                    "تصفير",
+                    on_click=lambda e: metrics.reset() or self.refresh_diagnostics_screen() or self.page.update(),
+                    style=ft.ButtonStyle(
+                        color="white",
+                        bgcolor="red"
+                    )
+                )
+            ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+            
+            # زر العودة
+            ft.ElevatedButton(
+                "العودة للرئيسية",
+                on_click=lambda e: self.show_screen("main"),
+                style=ft.ButtonStyle(bgcolor="gray"),
+                width=200
+            )
+        ], spacing=10)
+        
+        main_container.content = content_column
+        return main_container
+    
+    def refresh_diagnostics_screen(self):
+        self.diagnostics_list.controls.clear()
+        for name, stats in metrics.snapshot()["operations"].items():
+            text = (f"{name}\nعدد: {stats['count']}  متوسط: {stats['mean_ms']:.2f}ms  "
+                    f"p99: {stats['p99_ms']:.2f}ms  أقصى: {stats['max_ms']:.2f}ms")
+            if stats["bytes_written"]:
+                text += f"\nمكتوب: {stats['bytes_written'] / 1024:.1f}KB"
+            self.diagnostics_list.controls.append(self.create_info_text(text, 13))
+    
+    def dump_metrics(self, e):
+        filename = f"قياسات_الأداء_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        try:
+            metrics.dump(filename)
+            self.show_alert("نجاح", f'تم حفظ القياسات في ملف: {filename}')
+        except OSError:
+            self.show_alert("خطأ", 'حدث خطأ أثناء حفظ القياسات')
+    
+    def undo_redo(self, action):
+        # كل جلسة تتراجع عن عملياتها فقط
+        success, message = action(session=self)
+        
+        if success and not self.room_manager.wait_durable(timeout=10):
+            self.show_alert("خطأ", f"{message} لكن لم يكتمل حفظ التعديل بعد")
+        elif success:
+            self.show_alert("نجاح", message)
+        else:
+            self.show_alert("خطأ", message)
     
     def create_main_button(self, text, screen, bgcolor, text_color="black"):
         return ft.Container(
             content=ft.ElevatedButton(
                 text,
-                on_click=lambda e: self.show_screen(screen) if screen != "exit" else self.page.window_close(),
+                on_click=lambda e: self.show_screen(screen) if screen != "exit" else self.exit_app(),
                 style=ft.ButtonStyle(
                     color=text_color,
                     bgcolor=bgcolor
@@ -289,9 +361,12 @@ class AppScreenManager:
             )
         )
     
-    def show_bill_screen(self):
-        self.current_screen = "bill"
-        
+    def exit_app(self):
+        # كتابة التعديلات المعلقة قبل إغلاق النافذة
+        self.room_manager.flush()
+        self.page.window_close()
+    
+    def build_bill_screen(self):
         main_container = ft.Container(
             width=WINDOW_WIDTH,
             height=WINDOW_HEIGHT,
@@ -305,6 +380,20 @@ class AppScreenManager:
             spacing=10
         )
         
+        # شريط تقدم تصدير الفواتير
+        self.export_progress = ft.ProgressBar(width=150, value=0, visible=False)
+        
+        # نسب الجزء الموزع على جميع الطلاب للمقارنة، مثل 30,50,70
+        self.ratios_input = ft.TextField(
+            label="نسب التوزيع",
+            hint_text="30,50,70",
+            width=200,
+            border_color="gray",
+            bgcolor="white",
+            color="black",
+            text_size=14
+        )
+        
         content_column = ft.Column([
             # العنوان
             ft.Container(
@@ -352,14 +441,35 @@ class AppScreenManager:
                 )
             ]),
             
-            ft.Container(height=10),
+            # مقارنة عدة فواتير ونسب توزيع، الفواتير مفصولة بفواصل و"مبنى:مبلغ" لمبنى واحد
+            ft.Row([
+                self.ratios_input,
+                ft.ElevatedButton(
+                    "مقارنة",
+                    on_click=self.compare_bills,
+                    style=ft.ButtonStyle(bgcolor="gray")
+                )
+            ]),
+            
+            # تصدير فواتير كل الغرف في أرشيف واحد
+            ft.Row([
+                ft.ElevatedButton(
+                    "تصدير كل الفواتير",
+                    on_click=self.export_all_invoices,
+                    style=ft.ButtonStyle(
+                        color="white",
+                        bgcolor="#3366cc"
+                    )
+                ),
+                self.export_progress
+            ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
             
             # منطقة النتائج
             ft.Container(
                 content=ft.Column([
                     self.results_container
                 ]),
-                height=350,
+                height=250,
                 border=ft.border.all(1, "gray"),
                 padding=50
             ),
@@ -376,13 +486,19 @@ class AppScreenManager:
         ], spacing=10)
         
         main_container.content = content_column
-        self.page.add(main_container)
         
         # حفظ المرجع لحقل الفاتورة
         self.bill_input = content_column.controls[1].controls[2]
+        return main_container
+    
+    def refresh_bill_screen(self):
+        self.bill_input.value = ""
+        self.ratios_input.value = ""
+        self.results_container.controls.clear()
         self.calculation_result = None
         self.bill_amount = 0
     
+    @timed("handler.calculate_bill")
     def calculate_bill(self, e):
         bill_amount = self.bill_input.value.strip()
         if not bill_amount:
@@ -412,21 +528,21 @@ class AppScreenManager:
         self.results_container.controls.append(prices_card)
         
         # عرض تفاصيل الغرف
-        for room_num, room_data in self.room_manager.rooms.items():
-            total_students_in_room = room_data[1] + room_data[2]
-            room_share_all = total_students_in_room * student_share
-            room_share_laptop = room_data[1] * laptop_share
-            total_cost = room_share_all + room_share_laptop
+        share_all, share_laptop, totals = self.room_manager.rooms.bill_breakdown(student_share, laptop_share)
+        for (room_num, room), room_share_all, room_share_laptop, total_cost in zip(
+            self.room_manager.rooms.items(), share_all, share_laptop, totals
+        ):
+            total_students_in_room = room.total_students
             
             room_info = f"""الغرفة: {room_num}
 الطلاب الكلي: {total_students_in_room} → {room_share_all:.2f}
-طلاب مع لابتوب: {room_data[1]} → {room_share_laptop:.2f}
+طلاب مع لابتوب: {room.has_laptop} → {room_share_laptop:.2f}
 المبلغ المضاف: {total_cost:.2f}"""
             
             room_card = self.create_room_card(
                 room_info, 
                 room_num, 
-                room_data, 
+                room, 
                 student_share, 
                 laptop_share, 
                 total_cost
@@ -435,6 +551,34 @@ class AppScreenManager:
         
         self.page.update()
     
+    def compare_bills(self, e):
+        amounts = [text for text in self.bill_input.value.split(",") if text.strip()]
+        ratios = [text for text in self.ratios_input.value.split(",") if text.strip()]
+        matrix, error = self.room_manager.compare_bills(amounts, ratios)
+        if error:
+            self.show_alert("خطأ", error)
+            return
+        
+        # المقارنة لا تطبق، فيلغى أي حساب سابق حتى لا يطبق بالخطأ
+        self.calculation_result = None
+        self.results_container.controls.clear()
+        for summary in matrix.summary():
+            self.results_container.controls.append(self.create_card(
+                f"{summary['scenario']}\n"
+                f"على جميع الطلاب: {summary['student_share']:.2f} للطالب\n"
+                f"على أصحاب الأجهزة: {summary['laptop_share']:.2f} للطالب\n"
+                f"أعلى حصة غرفة: {summary['max_room']:.2f}",
+                "#f5f5f5"
+            ))
+        
+        # حصة كل غرفة في كل سيناريو لأول صفحة من الغرف
+        labels = [scenario.label for scenario in matrix.scenarios]
+        for room_num, charges in matrix.rows(0, ROOMS_PAGE_SIZE):
+            lines = [f"الغرفة: {room_num}"]
+            lines.extend(f"{label}: {charge:.2f}" for label, charge in zip(labels, charges))
+            self.results_container.controls.append(self.create_card("\n".join(lines), "#e3f2fd"))
+        self.page.update()
+    
     def create_card(self, content, bgcolor):
         return ft.Container(
             content=ft.Text(
@@ -448,7 +592,7 @@ class AppScreenManager:
             border_radius=5
         )
     
-    def create_room_card(self, room_info, room_num, room_data, student_share, laptop_share, total_cost):
+    def create_room_card(self, room_info, room_num, room, student_share, laptop_share, total_cost):
         return ft.Container(
             content=ft.Column([
                 ft.Text(
@@ -460,7 +604,7 @@ class AppScreenManager:
                 ft.Container(height=10),
                 ft.ElevatedButton(
                     "عرض الفاتورة",
-                    on_click=lambda e, rn=room_num, rd=room_data, ss=student_share, 
+                    on_click=lambda e, rn=room_num, rd=room, ss=student_share, 
                                    ls=laptop_share, tc=total_cost: 
                     self.show_invoice(rn, rd, ss, ls, tc),
                     style=ft.ButtonStyle(
@@ -474,66 +618,10 @@ class AppScreenManager:
             border_radius=5
         )
     
-    def show_invoice(self, room_num, room_data, student_share, laptop_share, total_cost):
-        # حساب التواريخ
-        current_date = datetime.now()
-        due_date = current_date + timedelta(days=3)
-        
-        # حساب التفاصيل المالية
-        total_students_in_room = room_data[1] + room_data[2]
-        students_without_laptop = room_data[2]
-        students_with_laptop = room_data[1]
-        
-        cost_without_laptop = students_without_laptop * student_share
-        cost_with_laptop = students_with_laptop * (student_share + laptop_share)
-        
-        previous_bill = room_data[3]  # المبلغ المتراكم السابق
-        new_total_bill = previous_bill + total_cost  # المبلغ الإجمالي الجديد
-        
-        # إنشاء محتوى الفاتورة
-        invoice_content = f"""
-بيت الطالب
-
-فاتورة الكهرباء
-قيمة الفاتورة الكلية: {self.bill_amount:.2f}
-المبلغ على جميع الطلاب: {student_share:.2f} للطالب
-المبلغ الإضافي على حاملي اللابتوب: {laptop_share:.2f} للطالب
-
-────────────────────
-
-حصة الغرفة:
-اسم المسؤول: {room_data[0]}
-رقم الغرفة: {room_num}
-عدد الطلاب الكلي: {total_students_in_room}
-عدد الطلاب بدون لابتوب: {students_without_laptop}
-عدد الطلاب مع لابتوب: {students_with_laptop}
-
-طلاب بدون لابتوب:
-- نصيب الفرد: {student_share:.2f}
-- العدد: {students_without_laptop}
-- الإجمالي: {cost_without_laptop:.2f}
-
-طلاب مع لابتوب:
-- نصيب الفرد: {student_share + laptop_share:.2f}
-- العدد: {students_with_laptop}
-- الإجمالي: {cost_with_laptop:.2f}
-
-إجمالي هذه الفاتورة: {total_cost:.2f}
-المبلغ المتبقي من فواتير سابقة: {previous_bill:.2f}
-المبلغ الإجمالي على الغرفة: {new_total_bill:.2f}
-
-────────────────────
-
-ملاحظات:
-• مهلة السداد: 3 أيام من تاريخ صدور الفاتورة
-• آخر موعد للسداد: {due_date.strftime('%Y-%m-%d')}
-• يمكنكم التسديد على الحساب البنكي:
-  البنك: الكريمي
-  رقم الحساب: 3170319515
-  اسم الحساب: همدان فارس
-
-تاريخ الإصدار: {current_date.strftime('%Y-%m-%d')}
-"""
+    def show_invoice(self, room_num, room, student_share, laptop_share, total_cost):
+        invoice_content = self.invoice_renderer.render(
+            room_num, room.to_record(), room.version, self.bill_amount, student_share, laptop_share, total_cost
+        )
         
         # عرض الفاتورة في نافذة منبثقة
         self.show_invoice_dialog(invoice_content, room_num)
@@ -603,21 +691,70 @@ class AppScreenManager:
             self.dialog.open = False
             self.page.update()
     
+    def export_all_invoices(self, e):
+        if not self.calculation_result:
+            self.show_alert("خطأ", "يرجى حساب الفاتورة أولاً")
+            return
+        if self.export_progress.visible:
+            return
+        
+        # أخذ نسخة من بيانات الغرف داخل القفل حتى لا يختلط سداد من جلسة أخرى بالنسخة، ثم التوليد في الخلفية
+        student_share, laptop_share = self.calculation_result
+        with self.room_manager.lock:
+            rooms = self.room_manager.rooms
+            totals = rooms.bill_breakdown(student_share, laptop_share)[2]
+            jobs = [
+                (room_num, room.to_record(), room.version, total)
+                for (room_num, room), total in zip(rooms.items(), totals)
+            ]
+        filename = f"فواتير_الغرف_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        
+        self.export_progress.value = 0
+        self.export_progress.visible = True
+        self.page.update()
+        
+        threading.Thread(
+            target=self.run_invoice_export,
+            args=(filename, jobs, self.bill_amount, student_share, laptop_share),
+            daemon=True
+        ).start()
+    
+    def run_invoice_export(self, filename, jobs, bill_amount, student_share, laptop_share):
+        step = max(1, len(jobs) // 100)
+        
+        def progress(done, total):
+            if done % step == 0 or done == total:
+                self.export_progress.value = done / total
+                self.page.update()
+        
+        try:
+            export_invoices(filename, jobs, bill_amount, student_share, laptop_share, self.invoice_renderer, progress)
+            self.export_progress.visible = False
+            self.show_alert("نجاح", f'تم حفظ فواتير {len(jobs)} غرفة في ملف: {filename}')
+        except Exception:
+            self.export_progress.visible = False
+            self.show_alert("خطأ", 'حدث خطأ أثناء تصدير الفواتير')
+    
+    @timed("handler.apply_bill")
     def apply_bill(self, e):
         if not self.calculation_result:
             self.show_alert("خطأ", "يرجى حساب الفاتورة أولاً")
             return
         
         student_share, laptop_share = self.calculation_result
-        success = self.room_manager.apply_bill_to_rooms(student_share, laptop_share)
+        success = self.room_manager.apply_bill_to_rooms(student_share, laptop_share, session=self)
+        
+        # الفاتورة تعدل كل الغرف فننتظر حفظها قبل إبلاغ المستخدم
+        if success and not self.room_manager.wait_durable(timeout=10):
+            self.show_alert("خطأ", "تم تطبيق الفاتورة لكن لم يكتمل حفظها بعد")
+            self.calculation_result = None
+            return
         
         if success:
             self.show_alert("نجاح", "تم تطبيق الفاتورة على جميع الغرف بنجاح")
             self.calculation_result = None
     
-    def show_rooms_screen(self):
-        self.current_screen = "rooms"
-        
+    def build_rooms_screen(self):
         main_container = ft.Container(
             width=WINDOW_WIDTH,
             height=WINDOW_HEIGHT,
@@ -625,11 +762,13 @@ class AppScreenManager:
             bgcolor="white"
         )
         
-        # حاوية الغرف القابلة للتمرير
-        self.rooms_container = ft.Column(
-            scroll=ft.ScrollMode.ALWAYS,
-            spacing=10
+        # قائمة الغرف القابلة للتمرير، تبنى منها صفحة واحدة فقط في كل مرة
+        self.rooms_container = ft.ListView(
+            spacing=10,
+            expand=True
         )
+        self.rooms_page = 0
+        self.rooms_page_label = ft.Text("", size=16, color="black")
         
         content_column = ft.Column([
             # العنوان
@@ -648,12 +787,45 @@ class AppScreenManager:
             # منطقة الغرف
             ft.Container(
                 content=self.rooms_container,
-                height=450,
+                height=400,
                 border=ft.border.all(1, "gray"),
                 padding=10
             ),
             
-            ft.Container(height=10),
+            # التنقل بين الصفحات
+            ft.Row([
+                ft.ElevatedButton(
+                    "السابق",
+                    on_click=lambda e: self.change_rooms_page(-1),
+                    style=ft.ButtonStyle(bgcolor="gray")
+                ),
+                self.rooms_page_label,
+                ft.ElevatedButton(
+                    "التالي",
+                    on_click=lambda e: self.change_rooms_page(1),
+                    style=ft.ButtonStyle(bgcolor="gray")
+                )
+            ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+            
+            # استيراد وتصدير قائمة الغرف كاملة
+            ft.Row([
+                ft.ElevatedButton(
+                    "استيراد الغرف من ملف",
+                    on_click=lambda e: self.pick_file(self.import_roster, ["csv", "json", "jsonl"]),
+                    style=ft.ButtonStyle(
+                        color="white",
+                        bgcolor="blue"
+                    )
+                ),
+                ft.ElevatedButton(
+                    "تصدير الغرف إلى ملف",
+                    on_click=self.export_roster,
+                    style=ft.ButtonStyle(
+                        color="white",
+                        bgcolor="green"
+                    )
+                )
+            ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
             
             # زر العودة
             ft.ElevatedButton(
@@ -665,29 +837,32 @@ class AppScreenManager:
         ], spacing=10)
         
         main_container.content = content_column
-        self.page.add(main_container)
-        
+        return main_container
+    
+    def refresh_rooms_screen(self):
+        self.update_rooms_display()
+    
+    def change_rooms_page(self, step):
+        self.rooms_page += step
         self.update_rooms_display()
     
     def update_rooms_display(self):
-        self.rooms_container.controls.clear()
+        rooms = self.room_manager.rooms
+        page_count = max(1, -(-len(rooms) // ROOMS_PAGE_SIZE))
+        self.rooms_page = min(max(self.rooms_page, 0), page_count - 1)
         
-        for room_num, room_data in self.room_manager.rooms.items():
-            room_info = f"""رقم الغرفة: {room_num}
-اسم المسؤول: {room_data[0]}
-الطلاب مع لابتوب: {room_data[1]}
-الطلاب بدون لابتوب: {room_data[2]}
-إجمالي الطلاب: {room_data[1] + room_data[2]}
-المبلغ المتراكم: {room_data[3]:.2f}"""
-            
+        # بناء بطاقات الصفحة الحالية فقط بدلاً من كل الغرف
+        self.rooms_container.controls.clear()
+        self.bindings.clear()
+        for room_num, room in rooms.page(self.rooms_page * ROOMS_PAGE_SIZE, ROOMS_PAGE_SIZE):
             room_card = ft.Container(
                 content=ft.Column([
-                    ft.Text(
-                        room_info,
-                        size=16,
-                        color="black",
-                        text_align=ft.TextAlign.CENTER
-                    ),
+                    self.create_info_text(f"رقم الغرفة: {room_num}", 16),
+                    self.bind(room_num, "name", self.create_info_text("", 16), "اسم المسؤول: {}"),
+                    self.bind(room_num, "has_laptop", self.create_info_text("", 16), "الطلاب مع لابتوب: {}"),
+                    self.bind(room_num, "no_laptop", self.create_info_text("", 16), "الطلاب بدون لابتوب: {}"),
+                    self.bind(room_num, "total_students", self.create_info_text("", 16), "إجمالي الطلاب: {}"),
+                    self.bind(room_num, "balance", self.create_info_text("", 16), "المبلغ المتراكم: {:.2f}"),
                     ft.Container(height=10),
                     ft.ElevatedButton(
                         "حذف المبلغ",
@@ -697,27 +872,28 @@ class AppScreenManager:
                             bgcolor="red"
                         )
                     )
-                ]),
+                ], spacing=0, horizontal_alignment=ft.CrossAxisAlignment.CENTER),
                 padding=10,
                 bgcolor="#e6e6e6",
                 border_radius=5
             )
             self.rooms_container.controls.append(room_card)
         
+        self.rooms_page_label.value = f"صفحة {self.rooms_page + 1} من {page_count}"
         self.page.update()
     
+    def create_info_text(self, value, size=14):
+        return ft.Text(value, size=size, color="black", text_align=ft.TextAlign.CENTER)
+    
     def reset_bill(self, room_num):
-        success, message = self.room_manager.reset_room_bill(room_num)
+        success, message = self.room_manager.reset_room_bill(room_num, session=self)
         
         if success:
-            self.update_rooms_display()
             self.show_alert("نجاح", message)
         else:
             self.show_alert("خطأ", message)
     
-    def show_edit_screen(self):
-        self.current_screen = "edit"
-        
+    def build_edit_screen(self):
         main_container = ft.Container(
             width=WINDOW_WIDTH,
             height=WINDOW_HEIGHT,
@@ -727,12 +903,16 @@ class AppScreenManager:
         
         # حقول الإدخال
         self.room_input_edit = ft.TextField(
-            label="رقم الغرفة",
+            label="رقم الغرفة أو اسم المسؤول",
             border_color="gray",
             bgcolor="white",
             color="black",
-            text_size=18
+            text_size=18,
+            on_change=lambda e: self.show_suggestions(
+                self.room_input_edit, self.suggestions_edit, self.search_room
+            )
         )
+        self.suggestions_edit = ft.Column(spacing=0)
         
         self.name_input = ft.TextField(
             label="اسم المسؤول الجديد",
@@ -760,7 +940,13 @@ class AppScreenManager:
             keyboard_type=ft.KeyboardType.NUMBER
         )
         
-        self.info_label_edit = ft.Text("", color="black", text_align=ft.TextAlign.CENTER)
+        # معلومات الغرفة، كل حقل في نص مستقل يحدث وحده
+        self.info_texts_edit = [self.create_info_text("") for _ in range(4)]
+        self.info_label_edit = ft.Column(
+            self.info_texts_edit,
+            spacing=0,
+            horizontal_alignment=ft.CrossAxisAlignment.CENTER
+        )
         
         content_column = ft.Column([
             # العنوان
@@ -776,8 +962,9 @@ class AppScreenManager:
                 alignment=ft.alignment.center
             ),
             
-            # إدخال رقم الغرفة
+            # إدخال رقم الغرفة والغرف المقترحة أثناء الكتابة
             self.room_input_edit,
+            self.suggestions_edit,
             
             ft.Container(height=10),
             
@@ -821,34 +1008,71 @@ class AppScreenManager:
         ], spacing=10)
         
         main_container.content = content_column
-        self.page.add(main_container)
-        
+        return main_container
+    
+    def refresh_edit_screen(self):
         self.current_room = None
+        for field in (self.room_input_edit, self.name_input, self.has_laptop_input, self.no_laptop_input):
+            field.value = ""
+        for text in self.info_texts_edit:
+            text.value = ""
+        self.suggestions_edit.controls.clear()
+    
+    def show_suggestions(self, field, suggestions, on_select):
+        # الغرف الأقرب لما كتب حتى الآن، اختيار غرفة يضع رقمها في الحقل ويبحث عنها
+        suggestions.controls.clear()
+        rooms = self.room_manager.rooms
+        for room_num in self.room_manager.search_rooms(field.value, SEARCH_SUGGESTIONS):
+            if room_num == field.value.strip():
+                continue
+            suggestions.controls.append(ft.TextButton(
+                f"{room_num} - {rooms[room_num].name}",
+                on_click=lambda e, room_num=room_num: self.select_suggestion(field, suggestions, on_select, room_num)
+            ))
+        self.page.update()
+    
+    def select_suggestion(self, field, suggestions, on_select, room_num):
+        field.value = room_num
+        suggestions.controls.clear()
+        on_select(None)
+    
+    def find_room(self, query):
+        # الرقم المكتوب كما هو إن وجد، وإلا أقرب غرفة للرقم أو الاسم المكتوب
+        if query in self.room_manager.rooms:
+            return query
+        matches = self.room_manager.search_rooms(query, 1)
+        return matches[0] if matches else None
     
     def search_room(self, e):
-        room_num = self.room_input_edit.value.strip()
-        if not room_num:
+        query = self.room_input_edit.value.strip()
+        if not query:
             self.show_alert("خطأ", "يرجى إدخال رقم الغرفة")
             return
         
-        if room_num not in self.room_manager.rooms:
+        room_num = self.find_room(query)
+        if room_num is None:
             self.show_alert("خطأ", "رقم الغرفة غير موجود")
             return
+        self.room_input_edit.value = room_num
+        self.suggestions_edit.controls.clear()
         
         self.current_room = room_num
-        room_data = self.room_manager.rooms[room_num]
-        
-        room_info = f"""الغرفة: {room_num}
-المسؤول الحالي: {room_data[0]}
-الطلاب مع لابتوب: {room_data[1]}
-الطلاب بدون لابتوب: {room_data[2]}"""
-        
-        self.info_label_edit.value = room_info
-        self.name_input.value = room_data[0]
-        self.has_laptop_input.value = str(room_data[1])
-        self.no_laptop_input.value = str(room_data[2])
+        room = self.room_manager.rooms[room_num]
+        self.current_room_version = room.version
+        
+        room_text, name_text, laptop_text, no_laptop_text = self.info_texts_edit
+        self.unbind(self.info_texts_edit)
+        room_text.value = f"الغرفة: {room_num}"
+        self.bind(room_num, "name", name_text, "المسؤول الحالي: {}")
+        self.bind(room_num, "has_laptop", laptop_text, "الطلاب مع لابتوب: {}")
+        self.bind(room_num, "no_laptop", no_laptop_text, "الطلاب بدون لابتوب: {}")
+        
+        self.name_input.value = room.name
+        self.has_laptop_input.value = str(room.has_laptop)
+        self.no_laptop_input.value = str(room.no_laptop)
         self.page.update()
     
+    @timed("handler.update_room")
     def update_room(self, e):
         if not self.current_room:
             self.show_alert("خطأ", "يرجى البحث عن غرفة أولاً")
@@ -858,22 +1082,21 @@ class AppScreenManager:
         has_laptop = self.has_laptop_input.value.strip()
         no_laptop = self.no_laptop_input.value.strip()
         
-        success, message = self.room_manager.update_room(
+        success, message, version = self.room_manager.update_room(
             self.current_room, 
             name if name else None,
             has_laptop if has_laptop else None,
-            no_laptop if no_laptop else None
+            no_laptop if no_laptop else None,
+            expected_version=self.current_room_version
         )
         
         if success:
+            self.current_room_version = version
             self.show_alert("نجاح", message)
-            self.search_room(e)  # تحديث المعلومات
         else:
             self.show_alert("خطأ", message)
     
-    def show_payment_screen(self):
-        self.current_screen = "payment"
-        
+    def build_payment_screen(self):
         main_container = ft.Container(
             width=WINDOW_WIDTH,
             height=WINDOW_HEIGHT,
@@ -883,12 +1106,16 @@ class AppScreenManager:
         
         # حقول الإدخال
         self.room_input_payment = ft.TextField(
-            label="رقم الغرفة",
+            label="رقم الغرفة أو اسم المسؤول",
             border_color="gray",
             bgcolor="white",
             color="black",
-            text_size=18
+            text_size=18,
+            on_change=lambda e: self.show_suggestions(
+                self.room_input_payment, self.suggestions_payment, self.search_room_payment
+            )
         )
+        self.suggestions_payment = ft.Column(spacing=0)
         
         self.amount_input = ft.TextField(
             label="المبلغ المسدد",
@@ -899,7 +1126,13 @@ class AppScreenManager:
             keyboard_type=ft.KeyboardType.NUMBER
         )
         
-        self.info_label_payment = ft.Text("", color="black", text_align=ft.TextAlign.CENTER)
+        # معلومات الغرفة، كل حقل في نص مستقل يحدث وحده
+        self.info_texts_payment = [self.create_info_text("") for _ in range(3)]
+        self.info_label_payment = ft.Column(
+            self.info_texts_payment,
+            spacing=0,
+            horizontal_alignment=ft.CrossAxisAlignment.CENTER
+        )
         
         content_column = ft.Column([
             # العنوان
@@ -915,8 +1148,9 @@ class AppScreenManager:
                 alignment=ft.alignment.center
             ),
             
-            # إدخال رقم الغرفة
+            # إدخال رقم الغرفة والغرف المقترحة أثناء الكتابة
             self.room_input_payment,
+            self.suggestions_payment,
             
             ft.Container(height=10),
             
@@ -951,6 +1185,18 @@ class AppScreenManager:
             
             ft.Container(height=10),
             
+            # استيراد مدفوعات كثيرة من ملف CSV أو JSON
+            ft.ElevatedButton(
+                "استيراد مدفوعات من ملف",
+                on_click=lambda e: self.pick_file(self.import_payments, ["csv", "json", "jsonl"]),
+                style=ft.ButtonStyle(
+                    color="white",
+                    bgcolor="blue"
+                )
+            ),
+            
+            ft.Container(height=10),
+            
             # زر العودة
             ft.ElevatedButton(
                 "العودة للرئيسية",
@@ -961,31 +1207,42 @@ class AppScreenManager:
         ], spacing=10)
         
         main_container.content = content_column
-        self.page.add(main_container)
-        
+        return main_container
+    
+    def refresh_payment_screen(self):
         self.current_room_payment = None
+        self.room_input_payment.value = ""
+        self.amount_input.value = ""
+        for text in self.info_texts_payment:
+            text.value = ""
+        self.suggestions_payment.controls.clear()
     
     def search_room_payment(self, e):
-        room_num = self.room_input_payment.value.strip()
-        if not room_num:
+        query = self.room_input_payment.value.strip()
+        if not query:
             self.show_alert("خطأ", "يرجى إدخال رقم الغرفة")
             return
         
-        if room_num not in self.room_manager.rooms:
+        room_num = self.find_room(query)
+        if room_num is None:
             self.show_alert("خطأ", "رقم الغرفة غير موجود")
             return
+        self.room_input_payment.value = room_num
+        self.suggestions_payment.controls.clear()
         
         self.current_room_payment = room_num
-        room_data = self.room_manager.rooms[room_num]
+        self.current_room_payment_version = self.room_manager.room_version(room_num)
         
-        room_info = f"""الغرفة: {room_num}
-المسؤول: {room_data[0]}
-المبلغ المتراكم: {room_data[3]:.2f}"""
+        room_text, name_text, balance_text = self.info_texts_payment
+        self.unbind(self.info_texts_payment)
+        room_text.value = f"الغرفة: {room_num}"
+        self.bind(room_num, "name", name_text, "المسؤول: {}")
+        self.bind(room_num, "balance", balance_text, "المبلغ المتراكم: {:.2f}")
         
-        self.info_label_payment.value = room_info
         self.amount_input.value = ""
         self.page.update()
     
+    @timed("handler.pay_bill")
     def pay_bill(self, e):
         if not self.current_room_payment:
             self.show_alert("خطأ", "يرجى البحث عن غرفة أولاً")
@@ -996,14 +1253,65 @@ class AppScreenManager:
             self.show_alert("خطأ", "يرجى إدخال المبلغ المسدد")
             return
         
-        success, message = self.room_manager.pay_room_bill(self.current_room_payment, amount)
+        success, message, version = self.room_manager.pay_room_bill(
+            self.current_room_payment,
+            amount,
+            expected_version=self.current_room_payment_version,
+            session=self
+        )
         
         if success:
+            self.current_room_payment_version = version
+            self.amount_input.value = ""
             self.show_alert("نجاح", message)
-            self.search_room_payment(e)  # تحديث المعلومات
         else:
             self.show_alert("خطأ", message)
     
+    def import_roster(self, filename):
+        count, errors = self.room_manager.import_roster(filename)
+        if count and not self.room_manager.wait_durable(timeout=10):
+            self.show_alert("خطأ", f"تم استيراد {count} غرفة لكن لم يكتمل حفظها بعد")
+            return
+        if self.current_screen == "rooms":
+            self.update_rooms_display()
+        
+        message = f'تم استيراد {count} غرفة'
+        if errors:
+            report = f"تقرير_الغرف_المرفوضة_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            try:
+                write_rows(report, ("row", "error"), errors)
+                message += f'\nتم رفض {len(errors)} صف، التفاصيل في ملف: {report}'
+            except OSError:
+                message += f'\nتم رفض {len(errors)} صف، أولها الصف {errors[0][0]}: {errors[0][1]}'
+        self.show_alert("نجاح" if count else "خطأ", message)
+    
+    def export_roster(self, e):
+        filename = f"قائمة_الغرف_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        try:
+            count = self.room_manager.export_roster(filename)
+            self.show_alert("نجاح", f'تم حفظ {count} غرفة في ملف: {filename}')
+        except OSError:
+            self.show_alert("خطأ", 'حدث خطأ أثناء تصدير الغرف')
+    
+    def import_payments(self, filename):
+        applied, errors = self.room_manager.import_payments(filename, session=self)
+        if applied and not self.room_manager.wait_durable(timeout=10):
+            self.show_alert("خطأ", f"تم تسجيل {applied} دفعة لكن لم يكتمل حفظها بعد")
+            return
+        if applied and self.current_room_payment:
+            self.current_room_payment_version = self.room_manager.room_version(self.current_room_payment)
+        
+        message = f'تم تسجيل {applied} دفعة'
+        if errors:
+            # تقرير بالصفوف المرفوضة وسبب رفض كل صف
+            report = f"تقرير_المدفوعات_المرفوضة_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            try:
+                write_rows(report, ("row", "error"), errors)
+                message += f'\nتم رفض {len(errors)} صف، التفاصيل في ملف: {report}'
+            except OSError:
+                message += f'\nتم رفض {len(errors)} صف، أولها الصف {errors[0][0]}: {errors[0][1]}'
+        self.show_alert("نجاح" if applied else "خطأ", message)
+    
     def show_alert(self, title, message):
         def close_dialog(e):
             self.page.dialog.open = False
@@ -1019,7 +1327,12 @@ class AppScreenManager:
         self.page.update()
 
 def main(page: ft.Page):
-    app_manager = AppScreenManager(page)
+    try:
+        app_manager = AppScreenManager(page)
+    except ValueError as e:
+        # ملف بيانات تالف: لا يكتب فوقه ويعرض الخطأ حتى يستعاد الملف
+        page.add(ft.Text(str(e), size=18, color="red", text_align=ft.TextAlign.RIGHT))
+        return
     app_manager.show_screen("login")
 
 if __name__ == "__main__":
@@ -0,0 +1,514 @@
+import atexit
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from bulk_io import PAYMENT_COLUMNS, ROSTER_COLUMNS, parse_roster_row, read_rows, write_rows
+from history import HISTORY_SESSIONS, History
+from instrumentation import timed
+from ledger import CHARGE, Ledger, PAYMENT, RESET
+from room_table import IndexedRoomTable, RoomTable, ShardedRoomTable
+from scenarios import evaluate_scenarios, parse_scenarios
+from search_index import SEARCH_RESULTS_LIMIT, SearchIndex
+from storage import BackgroundWriter, make_storage
+
+# بيانات الغرف الافتراضية
+DEFAULT_ROOMS = {
+    "1112": ["بدون اسم", 0, 0, 0],
+    "13": ["بدون اسم", 0, 0, 0],
+    "2122": ["بدون اسم", 0, 0, 0],
+    "23": ["بدون اسم", 0, 0, 0],
+    "31": ["بدون اسم", 0, 0, 0],
+    "32": ["بدون اسم", 0, 0, 0],
+    "33": ["بدون اسم", 0, 0, 0],
+    "41": ["بدون اسم", 0, 0, 0],
+    "42": ["بدون اسم", 0, 0, 0],
+    "43": ["بدون اسم", 0, 0, 0],
+}
+
+# نوع التخزين: json (الافتراضي) أو sqlite أو sharded (ملف لكل مبنى) أو indexed (قراءة كل غرفة عند طلبها)
+# أو binary (لقطة ثنائية، تضغط إذا كان ROOMS_SNAPSHOT_COMPRESS=1)
+STORAGE_BACKEND = os.environ.get("ROOMS_STORAGE", "json")
+
+# عدد الغرف الجديدة التي تضاف للجدول مرة واحدة أثناء استيراد قائمة الغرف
+ROSTER_BATCH_SIZE = 1000
+
+# رسالة رفض التعديل عند تغير الغرفة من جلسة أخرى بعد عرضها
+CONFLICT_MESSAGE = 'تم تعديل بيانات الغرفة من مستخدم آخر، يرجى البحث عنها مجدداً'
+
+# رسالة رفض التراجع عند تغير رصيد غرفة من العملية بعدها من جلسة أخرى
+HISTORY_CONFLICT_MESSAGE = 'تم تعديل بعض غرف هذه العملية من مستخدم آخر بعدها، لا يمكن التراجع عنها أو إعادتها'
+
+class RoomManager:
+    def __init__(self, storage=None):
+        self.storage = storage or make_storage(STORAGE_BACKEND)
+        self.listeners = []
+        
+        # قفل قصير حول كل عملية تعديل حتى لا تضيع تعديلات الجلسات المتزامنة
+        self.lock = threading.RLock()
+        
+        # سجل المبالغ المضافة والمسددة لكل غرفة لمعرفة الرصيد في أي تاريخ سابق
+        self.ledger = Ledger()
+        self.ledger.load(self.storage.load_ledger())
+        
+        self.rooms = self.load_data()
+        
+        # فهرس البحث بالأرقام والأسماء يبنى عند أول بحث ثم يحدث مع كل تعديل
+        self.search_index = None
+        
+        # تاريخ مستقل لكل جلسة بأرصدة الغرف قبل كل فاتورة أو سداد أو تصفير وبعده للتراجع عنها وإعادتها،
+        # فلا تتراجع جلسة عن عمليات جلسة أخرى، والجلسة None لسطر الأوامر
+        # وعدد الجلسات محدود لأن جلسات الخدمة لا تغلق، فيحذف تاريخ الجلسة الأقدم استخداماً
+        self.histories = OrderedDict()
+        
+        # الحفظ يتم في الخلفية ويجمع التعديلات المتتالية في كتابة واحدة
+        self.writer = BackgroundWriter(self.storage, self.rooms, self.lock)
+        atexit.register(self.flush)
+        
+        # في التخزين المقسم والمفهرس تطابق أرصدة الغرف مع السجل عند تحميلها
+        if isinstance(self.rooms, RoomTable):
+            self.reconcile_ledger(zip(self.rooms.numbers, self.rooms.balance))
+    
+    def subscribe(self, listener):
+        # listener(room_num, field, value) يستدعى عند تغير حقل في غرفة
+        self.listeners.append(listener)
+    
+    def unsubscribe(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+    
+    def notify(self, room_num, field, value):
+        # room_num = None يعني أن الحقل تغير في كل الغرف
+        for listener in list(self.listeners):
+            try:
+                listener(room_num, field, value)
+            except:
+                pass
+    
+    @timed("rooms.load_data")
+    def load_data(self):
+        # التخزين المقسم حسب المبنى لا يحمل أي مبنى قبل استخدامه
+        if hasattr(self.storage, "load_building"):
+            if not self.storage.load_summaries():
+                self.storage.save({room_num: list(record) for room_num, record in DEFAULT_ROOMS.items()})
+            return ShardedRoomTable(self.storage, self.lock, self.reconcile_ledger)
+        
+        # التخزين المفهرس يقرأ سجل كل غرفة عند طلبها فقط
+        if hasattr(self.storage, "read_room"):
+            if not self.storage.room_count():
+                self.storage.save({room_num: list(record) for room_num, record in DEFAULT_ROOMS.items()})
+            return IndexedRoomTable(self.storage, self.lock, self.reconcile_ledger)
+        
+        # اللقطة الثنائية تحمل كأعمدة مباشرة إلى الجدول
+        if hasattr(self.storage, "load_table"):
+            rooms = self.storage.load_table()
+            if rooms is not None:
+                return rooms
+        else:
+            rooms = self.storage.load()
+            if rooms is not None:
+                return RoomTable(rooms)
+        
+        rooms = {room_num: list(record) for room_num, record in DEFAULT_ROOMS.items()}
+        self.storage.save(rooms)
+        return RoomTable(rooms)
+    
+    def reconcile_ledger(self, balances):
+        # الأرصدة التي لا يغطيها السجل تضاف كقيد افتتاحي أو تسوية، balances أزواج (رقم الغرفة، المبلغ)
+        with self.lock:
+            self.writer.mark_ledger(self.ledger.reconcile(balances, opening=True))
+    
+    @timed("rooms.save_data")
+    def save_data(self):
+        with self.lock:
+            self.writer.mark_all()
+        return self.writer.flush()
+    
+    def flush(self):
+        return self.writer.flush()
+    
+    def wait_durable(self, timeout=None):
+        # للمعالجات التي تحتاج التأكد من وصول التعديلات للقرص قبل المتابعة
+        return self.writer.wait_durable(timeout)
+    
+    def room_version(self, room_num):
+        room = self.rooms.get(room_num)
+        return None if room is None else room.version
+    
+    def calculate_bill(self, bill_amount):
+        try:
+            bill_amount = float(bill_amount)
+            if not math.isfinite(bill_amount):
+                raise ValueError
+            
+            with self.lock:
+                # حساب إجمالي عدد الطلاب
+                total_students = self.rooms.total_students()
+                
+                # حساب إجمالي الطلاب الذين يمتلكون لابتوب
+                total_with_laptop = self.rooms.total_with_laptop()
+            
+            if total_students == 0:
+                return None, None, 'لا يوجد طلاب لإجراء الحساب'
+            
+            # نظام المتوسط المرجح
+            # 50% من الفاتورة توزع بالتساوي على جميع الطلاب
+            student_share = (bill_amount * 0.5) / total_students if total_students > 0 else 0
+            
+            # 50% من الفاتورة توزع على الطلاب الذين يمتلكون أجهزة فقط
+            laptop_share = (bill_amount * 0.5) / total_with_laptop if total_with_laptop > 0 else 0
+            
+            return student_share, laptop_share, None
+        except ValueError:
+            return None, None, 'قيمة الفاتورة يجب أن تكون رقمية'
+        except ZeroDivisionError:
+            return None, None, 'لا يمكن القسمة على صفر في الحساب'
+    
+    def history(self, session):
+        history = self.histories.get(session)
+        if history is None:
+            history = self.histories[session] = History()
+            while len(self.histories) > HISTORY_SESSIONS:
+                self.histories.popitem(last=False)
+        else:
+            self.histories.move_to_end(session)
+        return history
+    
+    def forget_session(self, session):
+        # حذف تاريخ الجلسة عند إغلاقها
+        with self.lock:
+            self.histories.pop(session, None)
+    
+    def _balance_of(self, room_num):
+        room = self.rooms.get(room_num)
+        return None if room is None else room.balance
+    
+    def undo(self, session=None):
+        # التراجع عن آخر فاتورة أو سداد أو تصفير من نفس الجلسة، ويسجل في السجل كقيد معاكس من نفس النوع
+        with self.lock:
+            step = self.history(session).undo(self._balance_of)
+            if step is None:
+                return False, 'لا توجد عملية للتراجع عنها'
+            if step is False:
+                return False, HISTORY_CONFLICT_MESSAGE
+            label = self._restore_balances(step)
+        
+        self.notify(None, "balance", None)
+        return True, f'تم التراجع عن: {label}'
+    
+    def redo(self, session=None):
+        with self.lock:
+            step = self.history(session).redo(self._balance_of)
+            if step is None:
+                return False, 'لا توجد عملية لإعادتها'
+            if step is False:
+                return False, HISTORY_CONFLICT_MESSAGE
+            label = self._restore_balances(step)
+        
+        self.notify(None, "balance", None)
+        return True, f'تمت إعادة: {label}'
+    
+    def _restore_balances(self, step):
+        label, kind, balances = step
+        differences = []
+        for room_num, balance in balances.items():
+            room = self.rooms[room_num]
+            differences.append(balance - room.balance)
+            room.balance = balance
+        
+        # التراجع عن فاتورة قيد معاكس واحد لكل الغرف مثل الفاتورة نفسها
+        if kind == CHARGE:
+            ledger_entries = self.ledger.add_bill(list(balances), differences)
+        else:
+            ledger_entries = [
+                self.ledger.add(room_num, kind, difference) for room_num, difference in zip(balances, differences)
+            ]
+        if balances:
+            self.writer.mark_rooms(balances)
+            self.writer.mark_ledger(ledger_entries)
+        return label
+    
+    def compare_bills(self, amounts, ratios=None):
+        # حصة كل غرفة في عدة فواتير ونسب توزيع مقترحة دفعة واحدة بدون تعديل الغرف
+        # amounts مثل ["12000", "2:4000"] والمبلغ بعد ":" لمبنى واحد، ratios نسبة الجزء الموزع على جميع الطلاب
+        try:
+            scenarios = parse_scenarios(amounts, ratios)
+        except ValueError as e:
+            return None, str(e)
+        if not scenarios:
+            return None, 'يرجى إدخال قيمة الفاتورة'
+        
+        with self.lock:
+            if self.rooms.total_students() == 0:
+                return None, 'لا يوجد طلاب لإجراء الحساب'
+            try:
+                return evaluate_scenarios(self.rooms, scenarios), None
+            except ValueError as e:
+                return None, str(e)
+    
+    def apply_bill_to_rooms(self, student_share, laptop_share, session=None):
+        with self.lock:
+            history = self.history(session)
+            history.track(zip(self.rooms.numbers, self.rooms.balance))
+            
+            # تحديث المبالغ في الغرف بناءً على نظام المتوسط المرجح في عملية واحدة على الأعمدة
+            totals = self.rooms.apply_bill(student_share, laptop_share)
+            self.writer.mark_bill(student_share, laptop_share)
+            self.writer.mark_ledger(self.ledger.add_bill(self.rooms.numbers, totals))
+            history.record(
+                f'تطبيق فاتورة ({student_share:.2f} للطالب، {laptop_share:.2f} للابتوب)', CHARGE,
+                zip(self.rooms.numbers, self.rooms.balance)
+            )
+        
+        self.notify(None, "balance", None)
+        return True
+    
+    def update_room(self, room_num, name=None, has_laptop=None, no_laptop=None, expected_version=None):
+        # يعيد (نجاح، رسالة، نسخة الغرفة بعد التعديل) والنسخة تقرأ داخل القفل فلا تشمل تعديل جلسة أخرى بعده
+        try:
+            has_laptop = int(has_laptop) if has_laptop is not None else None
+            no_laptop = int(no_laptop) if no_laptop is not None else None
+        except ValueError:
+            return False, 'قيم الطلاب يجب أن تكون أرقاماً', None
+        
+        with self.lock:
+            room = self.rooms.get(room_num)
+            if room is None:
+                return False, 'رقم الغرفة غير موجود', None
+            if expected_version is not None and room.version != expected_version:
+                return False, CONFLICT_MESSAGE, None
+            
+            if name is not None:
+                room.name = name
+                if self.search_index is not None:
+                    self.search_index.update(room_num, room.name)
+            if has_laptop is not None:
+                room.has_laptop = has_laptop
+            if no_laptop is not None:
+                room.no_laptop = no_laptop
+            
+            self.writer.mark_room(room_num)
+            events = []
+            if name is not None:
+                events.append((room_num, "name", room.name))
+            if has_laptop is not None:
+                events.append((room_num, "has_laptop", room.has_laptop))
+            if no_laptop is not None:
+                events.append((room_num, "no_laptop", room.no_laptop))
+            if has_laptop is not None or no_laptop is not None:
+                events.append((room_num, "total_students", room.total_students))
+            version = room.version
+        
+        for event in events:
+            self.notify(*event)
+        return True, 'تم التحديث بنجاح', version
+    
+    def reset_room_bill(self, room_num, expected_version=None, session=None):
+        with self.lock:
+            room = self.rooms.get(room_num)
+            if room is None:
+                return False, 'رقم الغرفة غير موجود'
+            if expected_version is not None and room.version != expected_version:
+                return False, CONFLICT_MESSAGE
+            
+            previous_balance = room.balance
+            if previous_balance:
+                self.history(session).track([(room_num, previous_balance)])
+            room.balance = 0
+            self.writer.mark_room(room_num)
+            if previous_balance:
+                self.writer.mark_ledger([self.ledger.add(room_num, RESET, -previous_balance)])
+                self.history(session).record(f'تصفير الغرفة {room_num}', RESET, [(room_num, 0)])
+        
+        self.notify(room_num, "balance", 0)
+        return True, 'تم تصفير المبلغ للغرفة'
+    
+    def pay_room_bill(self, room_num, amount, expected_version=None, session=None):
+        # يعيد (نجاح، رسالة، نسخة الغرفة بعد السداد) مثل update_room
+        try:
+            amount = float(amount)
+        except ValueError:
+            return False, 'قيمة المبلغ يجب أن تكون رقمية', None
+        if not math.isfinite(amount):
+            return False, 'قيمة المبلغ يجب أن تكون رقمية', None
+        if amount <= 0:
+            return False, 'المبلغ يجب أن يكون أكبر من الصفر', None
+        
+        with self.lock:
+            room = self.rooms.get(room_num)
+            if room is None:
+                return False, 'رقم الغرفة غير موجود', None
+            if expected_version is not None and room.version != expected_version:
+                return False, CONFLICT_MESSAGE, None
+            
+            # التحقق والخصم داخل نفس القفل حتى لا يتجاوز سدادان متزامنان المبلغ المتراكم
+            if amount > room.balance:
+                return False, 'المبلغ المسدد أكبر من المبلغ المتراكم', None
+            
+            history = self.history(session)
+            history.track([(room_num, room.balance)])
+            room.balance -= amount
+            self.writer.mark_room(room_num)
+            self.writer.mark_ledger([self.ledger.add(room_num, PAYMENT, -amount)])
+            balance = room.balance
+            version = room.version
+            history.record(f'سداد {amount:.2f} للغرفة {room_num}', PAYMENT, [(room_num, balance)])
+        
+        self.notify(room_num, "balance", balance)
+        return True, f'تم سداد {amount:.2f} من المبلغ المتراكم', version
+    
+    def import_payments(self, filename, session=None):
+        # قراءة الملف وتحويل القيم أولاً خارج القفل حتى لا تتوقف الجلسات الأخرى أثناء القراءة
+        payments = []
+        errors = []
+        try:
+            for row_number, values in read_rows(filename, PAYMENT_COLUMNS):
+                if not values or len(values) < 2:
+                    errors.append((row_number, 'صف غير مكتمل'))
+                    continue
+                try:
+                    amount = float(values[1])
+                    if not math.isfinite(amount):
+                        raise ValueError
+                    payments.append((row_number, str(values[0]).strip(), amount))
+                except (ValueError, TypeError):
+                    errors.append((row_number, 'قيمة المبلغ يجب أن تكون رقمية'))
+        except (OSError, ValueError):
+            return 0, [(0, 'تعذر قراءة ملف المدفوعات')]
+        
+        # التحقق من كل صف بنفس شروط السداد الفردي ثم تطبيق الصفوف الصحيحة دفعة واحدة
+        changed = set()
+        with self.lock:
+            history = self.history(session)
+            ledger_entries = []
+            for row_number, room_num, amount in payments:
+                if amount <= 0:
+                    errors.append((row_number, 'المبلغ يجب أن يكون أكبر من الصفر'))
+                    continue
+                room = self.rooms.get(room_num)
+                if room is None:
+                    errors.append((row_number, 'رقم الغرفة غير موجود'))
+                    continue
+                if amount > room.balance:
+                    errors.append((row_number, 'المبلغ المسدد أكبر من المبلغ المتراكم'))
+                    continue
+                
+                history.track([(room_num, room.balance)])
+                room.balance -= amount
+                changed.add(room_num)
+                ledger_entries.append(self.ledger.add(room_num, PAYMENT, -amount))
+            
+            if changed:
+                self.writer.mark_rooms(changed)
+                self.writer.mark_ledger(ledger_entries)
+                history.record(
+                    f'استيراد {len(ledger_entries)} دفعة', PAYMENT,
+                    ((room_num, self.rooms[room_num].balance) for room_num in changed)
+                )
+        
+        if changed:
+            self.notify(None, "balance", None)
+        errors.sort()
+        return len(ledger_entries), errors
+    
+    def import_roster(self, filename):
+        # المرور الأول يتحقق من الملف كاملاً بدون الاحتفاظ بالصفوف، ولا يطبق شيء إذا تعذرت قراءته
+        errors = []
+        try:
+            for row_number, values in read_rows(filename, ROSTER_COLUMNS):
+                try:
+                    parse_roster_row(values)
+                except ValueError as e:
+                    errors.append((row_number, str(e)))
+        except (OSError, ValueError):
+            return 0, [(0, 'تعذر قراءة ملف الغرف')]
+        
+        # المرور الثاني يطبق الصفوف الصحيحة داخل قفل واحد ثم تحفظ كلها في كتابة واحدة
+        count = 0
+        new_rooms = {}
+        with self.lock:
+            try:
+                for row_number, values in read_rows(filename, ROSTER_COLUMNS):
+                    try:
+                        room_num, record = parse_roster_row(values)
+                    except ValueError:
+                        continue
+                    room = self.rooms.get(room_num)
+                    if room is None:
+                        # الغرف الجديدة تضاف للجدول على دفعات محدودة الحجم
+                        if record[3] is None:
+                            record[3] = 0.0
+                        new_rooms[room_num] = record
+                        if len(new_rooms) >= ROSTER_BATCH_SIZE:
+                            self.rooms.load_records(new_rooms)
+                            new_rooms = {}
+                    else:
+                        if record[3] is None:
+                            record[3] = room.balance
+                        self.rooms.set_record(room_num, record)
+                    if self.search_index is not None:
+                        self.search_index.update(room_num, record[0])
+                    count += 1
+            except (OSError, ValueError):
+                errors.append((0, 'توقفت قراءة ملف الغرف قبل نهايته'))
+            self.rooms.load_records(new_rooms)
+            
+            if count:
+                # الأرصدة تغيرت من خارج التاريخ فلا يمكن التراجع عن العمليات السابقة في أي جلسة بعد الاستيراد
+                for history in self.histories.values():
+                    history.clear()
+                self.writer.mark_all()
+                # الأرصدة التي تغيرت من الملف تسجل كقيود تسوية
+                self.writer.mark_ledger(self.ledger.reconcile(zip(self.rooms.numbers, self.rooms.balance)))
+        
+        if count:
+            for field in ("name", "has_laptop", "no_laptop", "total_students", "balance"):
+                self.notify(None, field, None)
+        return count, errors
+    
+    def export_roster(self, filename):
+        # الكتابة داخل القفل لتكون القائمة متسقة، والصفوف تكتب واحداً تلو الآخر بدون نسخ الجدول
+        with self.lock:
+            rooms = self.rooms
+            return write_rows(filename, ROSTER_COLUMNS, zip(
+                rooms.numbers, rooms.names, rooms.has_laptop, rooms.no_laptop, rooms.balance
+            ))
+    
+    def search_rooms(self, query, limit=SEARCH_RESULTS_LIMIT):
+        # أرقام الغرف المطابقة لرقم أو جزء منه أو لاسم المسؤول، الأقرب أولاً
+        with self.lock:
+            if self.search_index is None:
+                self.search_index = SearchIndex(zip(self.rooms.numbers, self.rooms.names))
+            return self.search_index.search(query, limit)
+    
+    def _load_ledger_rooms(self, room_num):
+        # في التخزين المقسم والمفهرس الأرصدة الافتتاحية تسجل في السجل عند تحميل الغرف،
+        # فتحمل الغرفة المطلوبة أو كل الغرف لمجموعها قبل الاستعلام من السجل
+        if room_num is not None:
+            self.rooms.get(room_num)
+        elif hasattr(self.rooms, "load_all"):
+            self.rooms.load_all()
+    
+    def balance_as_of(self, room_num, when):
+        # الرصيد كما كان في تاريخ معين، room_num = None لمجموع كل الغرف
+        with self.lock:
+            self._load_ledger_rooms(room_num)
+            return self.ledger.balance_as_of(room_num, when.timestamp())
+    
+    def payments_between(self, room_num, start, end):
+        # مجموع ما سدد بين تاريخين، room_num = None لكل الغرف
+        with self.lock:
+            self._load_ledger_rooms(room_num)
+            return self.ledger.payments_between(room_num, start.timestamp(), end.timestamp())
+
+# مدير غرف واحد مشترك بين كل الجلسات في نفس العملية (مثل وضع الويب)
+_shared_room_manager = None
+_shared_room_manager_lock = threading.Lock()
+
+def get_room_manager():
+    global _shared_room_manager
+    with _shared_room_manager_lock:
+        if _shared_room_manager is None:
+            _shared_room_manager = RoomManager()
+        return _shared_room_manager
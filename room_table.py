@@ -0,0 +1,628 @@
+import math
+import os
+from array import array
+from itertools import chain, compress, repeat
+from operator import add, eq, itemgetter, mul
+
+# مقارنة المجاميع المحدثة تدريجياً مع إعادة العد الكامل عند كل قراءة
+DEBUG_AGGREGATES = os.environ.get("ROOMS_DEBUG") == "1"
+
+# مواضع المجاميع الفرعية لكل مبنى، وعدد الغرف في ملخص المبنى المحفوظ
+LAPTOP_SUM, NO_LAPTOP_SUM, BALANCE_SUM, ROOM_COUNT = range(4)
+
+
+def building_of(room_num):
+    # المبنى هو الرقم الأول من رقم الغرفة
+    return room_num[:1]
+
+
+class Room:
+    # سجل غرفة واحدة مرتبط بصفها في الجدول بدون نسخ القيم
+    __slots__ = ("table", "row")
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    @property
+    def number(self):
+        return self.table.numbers[self.row]
+
+    @property
+    def name(self):
+        return self.table.names[self.row]
+
+    @name.setter
+    def name(self, value):
+        self.table.set_name(self.row, str(value))
+
+    @property
+    def has_laptop(self):
+        return self.table.has_laptop[self.row]
+
+    @has_laptop.setter
+    def has_laptop(self, value):
+        self.table.set_has_laptop(self.row, int(value))
+
+    @property
+    def no_laptop(self):
+        return self.table.no_laptop[self.row]
+
+    @no_laptop.setter
+    def no_laptop(self, value):
+        self.table.set_no_laptop(self.row, int(value))
+
+    @property
+    def balance(self):
+        return self.table.balance[self.row]
+
+    @balance.setter
+    def balance(self, value):
+        self.table.set_balance(self.row, value)
+
+    @property
+    def version(self):
+        # يزيد مع كل تعديل على الغرفة
+        return self.table.versions[self.row]
+
+    @property
+    def total_students(self):
+        return self.table.has_laptop[self.row] + self.table.no_laptop[self.row]
+
+    def to_record(self):
+        # الصيغة المحفوظة على القرص: [الاسم، مع لابتوب، بدون لابتوب، المبلغ]
+        row = self.row
+        table = self.table
+        return [table.names[row], table.has_laptop[row], table.no_laptop[row], table.balance[row]]
+
+
+class RoomTable:
+    # تخزين الغرف في أعمدة متجاورة بحيث تتم العمليات على كل الغرف دفعة واحدة
+    def __init__(self, records=None):
+        self.index = {}
+        self.numbers = []
+        self.names = []
+        self.has_laptop = array('q')
+        self.no_laptop = array('q')
+        self.balance = array('d')
+        self.versions = array('q')
+
+        # مجاميع تحدث مع كل تعديل بدلاً من إعادة الجمع على كل الغرف
+        self.laptop_total = 0
+        self.no_laptop_total = 0
+        self.balance_total = 0.0
+        self.buildings = {}
+
+        if records:
+            self.load_records(records)
+
+    def load_records(self, records):
+        # تحويل سجلات القرص إلى أعمدة دفعة واحدة
+        new_numbers = [room_num for room_num in records if room_num not in self.index]
+        for room_num in records:
+            if room_num in self.index:
+                self.set_record(room_num, records[room_num])
+        if not new_numbers:
+            return
+
+        names, has_laptop, no_laptop, balance = zip(*(records[room_num] for room_num in new_numbers))
+        start = len(self.numbers)
+        self.index.update(zip(new_numbers, range(start, start + len(new_numbers))))
+        self.numbers.extend(new_numbers)
+        self.names.extend(names)
+        self.has_laptop.extend(map(int, has_laptop))
+        self.no_laptop.extend(map(int, no_laptop))
+        self.balance.extend(map(float, balance))
+        self.versions.extend(repeat(0, len(new_numbers)))
+
+        for row in range(start, len(self.numbers)):
+            self._add_to_totals(row)
+
+    def load_columns(self, numbers, names, has_laptop, no_laptop, balance):
+        # تحميل أعمدة جاهزة (مثل اللقطة الثنائية) بدون المرور على كل غرفة
+        if self.numbers:
+            self.load_records(dict(zip(numbers, map(list, zip(names, has_laptop, no_laptop, balance)))))
+            return
+        self.index = dict(zip(numbers, range(len(numbers))))
+        self.numbers = list(numbers)
+        self.names = list(names)
+        self.has_laptop = array('q', has_laptop)
+        self.no_laptop = array('q', no_laptop)
+        self.balance = array('d', balance)
+        self.versions = array('q', bytes(self.versions.itemsize * len(numbers)))
+
+        # المجاميع لكل مبنى بعمليات على الأعمدة، مرة لكل مبنى
+        buildings = list(map(itemgetter(slice(None, 1)), self.numbers))
+        for building in set(buildings):
+            mask = list(map(eq, buildings, repeat(building)))
+            self.buildings[building] = [
+                sum(compress(self.has_laptop, mask)),
+                sum(compress(self.no_laptop, mask)),
+                math.fsum(compress(self.balance, mask))
+            ]
+        self.laptop_total = sum(self.has_laptop)
+        self.no_laptop_total = sum(self.no_laptop)
+        self.balance_total = math.fsum(self.balance)
+
+    def to_records(self):
+        return dict(zip(self.numbers, map(list, zip(self.names, self.has_laptop, self.no_laptop, self.balance))))
+
+    def to_columns(self):
+        # نسخة من الأعمدة بالترتيب الذي تقبله load_columns
+        return list(self.numbers), list(self.names), array('q', self.has_laptop), array('q', self.no_laptop), \
+            array('d', self.balance)
+
+    def add_room(self, room_num, name, has_laptop=0, no_laptop=0, balance=0):
+        self.load_records({room_num: [name, has_laptop, no_laptop, balance]})
+        return self[room_num]
+
+    def set_record(self, room_num, record):
+        row = self.index[room_num]
+        self.set_name(row, record[0])
+        self.set_has_laptop(row, int(record[1]))
+        self.set_no_laptop(row, int(record[2]))
+        self.set_balance(row, record[3])
+
+    def _building_totals(self, row):
+        building = building_of(self.numbers[row])
+        totals = self.buildings.get(building)
+        if totals is None:
+            totals = self.buildings[building] = [0, 0, 0.0]
+        return totals
+
+    def _add_to_totals(self, row):
+        totals = self._building_totals(row)
+        has_laptop = self.has_laptop[row]
+        no_laptop = self.no_laptop[row]
+        balance = self.balance[row]
+        totals[LAPTOP_SUM] += has_laptop
+        totals[NO_LAPTOP_SUM] += no_laptop
+        totals[BALANCE_SUM] += balance
+        self.laptop_total += has_laptop
+        self.no_laptop_total += no_laptop
+        self.balance_total += balance
+
+    def set_name(self, row, value):
+        self.names[row] = value
+        self.versions[row] += 1
+
+    def set_has_laptop(self, row, value):
+        delta = value - self.has_laptop[row]
+        self.has_laptop[row] = value
+        self.versions[row] += 1
+        self._building_totals(row)[LAPTOP_SUM] += delta
+        self.laptop_total += delta
+
+    def set_no_laptop(self, row, value):
+        delta = value - self.no_laptop[row]
+        self.no_laptop[row] = value
+        self.versions[row] += 1
+        self._building_totals(row)[NO_LAPTOP_SUM] += delta
+        self.no_laptop_total += delta
+
+    def set_balance(self, row, value):
+        delta = value - self.balance[row]
+        self.balance[row] = value
+        self.versions[row] += 1
+        self._building_totals(row)[BALANCE_SUM] += delta
+        self.balance_total += delta
+
+    def __contains__(self, room_num):
+        return room_num in self.index
+
+    def __getitem__(self, room_num):
+        return Room(self, self.index[room_num])
+
+    def get(self, room_num):
+        row = self.index.get(room_num)
+        return None if row is None else Room(self, row)
+
+    def __iter__(self):
+        return iter(self.numbers)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def keys(self):
+        return list(self.numbers)
+
+    def values(self):
+        return [Room(self, row) for row in range(len(self.numbers))]
+
+    def items(self):
+        return [(room_num, Room(self, row)) for row, room_num in enumerate(self.numbers)]
+
+    def page(self, start, count):
+        # مجموعة متتالية من الغرف بدون بناء سجلات لباقي الجدول
+        end = min(start + count, len(self.numbers))
+        return [(self.numbers[row], Room(self, row)) for row in range(start, end)]
+
+    def total_with_laptop(self):
+        if DEBUG_AGGREGATES:
+            self.verify_totals()
+        return self.laptop_total
+
+    def total_students(self):
+        if DEBUG_AGGREGATES:
+            self.verify_totals()
+        return self.laptop_total + self.no_laptop_total
+
+    def total_balance(self):
+        if DEBUG_AGGREGATES:
+            self.verify_totals()
+        return self.balance_total
+
+    def building_totals(self, building):
+        # (مع لابتوب، بدون لابتوب، المبلغ المتراكم) لمبنى واحد
+        if DEBUG_AGGREGATES:
+            self.verify_totals()
+        return tuple(self.buildings.get(building, (0, 0, 0.0)))
+
+    def verify_totals(self):
+        # إعادة العد الكامل للتأكد من صحة المجاميع المحدثة تدريجياً
+        recount = {}
+        for row, room_num in enumerate(self.numbers):
+            totals = recount.setdefault(building_of(room_num), [0, 0, 0.0])
+            totals[LAPTOP_SUM] += self.has_laptop[row]
+            totals[NO_LAPTOP_SUM] += self.no_laptop[row]
+            totals[BALANCE_SUM] += self.balance[row]
+
+        assert self.laptop_total == sum(self.has_laptop), 'مجموع أصحاب الأجهزة غير مطابق'
+        assert self.no_laptop_total == sum(self.no_laptop), 'مجموع الطلاب بدون أجهزة غير مطابق'
+        assert math.isclose(self.balance_total, sum(self.balance), rel_tol=1e-9, abs_tol=1e-6), \
+            'مجموع المبالغ المتراكمة غير مطابق'
+        for building, totals in recount.items():
+            current = self.buildings.get(building, (0, 0, 0.0))
+            assert current[LAPTOP_SUM] == totals[LAPTOP_SUM] and current[NO_LAPTOP_SUM] == totals[NO_LAPTOP_SUM] \
+                and math.isclose(current[BALANCE_SUM], totals[BALANCE_SUM], rel_tol=1e-9, abs_tol=1e-6), \
+                f'مجاميع المبنى {building} غير مطابقة'
+
+    def bill_breakdown(self, student_share, laptop_share):
+        # حساب حصة كل غرفة من الجزأين والمجموع في عمليات على الأعمدة كاملة
+        share_all = array('d', map(mul, map(add, self.has_laptop, self.no_laptop), repeat(student_share)))
+        share_laptop = array('d', map(mul, self.has_laptop, repeat(laptop_share)))
+        total = array('d', map(add, share_all, share_laptop))
+        return share_all, share_laptop, total
+
+    def apply_bill(self, student_share, laptop_share):
+        total = self.bill_breakdown(student_share, laptop_share)[2]
+        self.balance[:] = array('d', map(add, self.balance, total))
+        self.versions[:] = array('q', map(add, self.versions, repeat(1)))
+
+        # إضافة الفاتورة للمجاميع من مجاميع الطلاب مباشرة بدون المرور على الغرف
+        for totals in self.buildings.values():
+            totals[BALANCE_SUM] += (totals[LAPTOP_SUM] + totals[NO_LAPTOP_SUM]) * student_share \
+                + totals[LAPTOP_SUM] * laptop_share
+        self.balance_total += (self.laptop_total + self.no_laptop_total) * student_share \
+            + self.laptop_total * laptop_share
+        return total
+
+
+class ShardedRoomTable:
+    # الغرف مقسمة حسب المبنى، وكل مبنى جدول مستقل يحمل من التخزين عند أول استخدام فقط
+    # والمجاميع الكلية تؤخذ من ملخصات المباني غير المحملة بدون تحميلها
+    def __init__(self, storage, lock, on_load=None):
+        self.storage = storage
+        self.lock = lock
+        self.on_load = on_load
+        self.summaries = dict(storage.load_summaries() or {})
+        self.shards = {}
+
+    def buildings(self):
+        return sorted(set(self.summaries) | set(self.shards))
+
+    def _add_shard(self, building, records):
+        shard = self.shards[building] = RoomTable(records)
+        if self.on_load:
+            self.on_load(zip(shard.numbers, shard.balance))
+        return shard
+
+    def shard(self, building, create=False):
+        shard = self.shards.get(building)
+        if shard is not None:
+            return shard
+        with self.lock:
+            shard = self.shards.get(building)
+            if shard is None:
+                if building in self.summaries:
+                    shard = self._add_shard(building, self.storage.load_building(building))
+                elif create:
+                    shard = self._add_shard(building, None)
+            return shard
+
+    def load_all(self):
+        # تحميل المباني المتبقية
+        with self.lock:
+            for building in self.buildings():
+                if building not in self.shards:
+                    self._add_shard(building, self.storage.load_building(building))
+
+    def loaded_shards(self):
+        self.load_all()
+        return [self.shards[building] for building in self.buildings()]
+
+    def _summary(self, building):
+        shard = self.shards.get(building)
+        if shard is not None:
+            return shard.laptop_total, shard.no_laptop_total, shard.balance_total, len(shard)
+        return tuple(self.summaries[building])
+
+    def load_records(self, records):
+        groups = {}
+        for room_num, record in records.items():
+            groups.setdefault(building_of(room_num), {})[room_num] = record
+        for building, group in groups.items():
+            self.shard(building, create=True).load_records(group)
+
+    def to_records(self):
+        # المباني غير المحملة لم تتغير فلا حاجة لإعادة حفظها
+        records = {}
+        for shard in list(self.shards.values()):
+            records.update(shard.to_records())
+        return records
+
+    def add_room(self, room_num, name, has_laptop=0, no_laptop=0, balance=0):
+        return self.shard(building_of(room_num), create=True).add_room(room_num, name, has_laptop, no_laptop, balance)
+
+    def set_record(self, room_num, record):
+        self[room_num].table.set_record(room_num, record)
+
+    def __contains__(self, room_num):
+        return self.get(room_num) is not None
+
+    def __getitem__(self, room_num):
+        room = self.get(room_num)
+        if room is None:
+            raise KeyError(room_num)
+        return room
+
+    def get(self, room_num):
+        # رقم غير نصي ليس غرفة، مثل باقي الجداول
+        if not isinstance(room_num, str):
+            return None
+        shard = self.shard(building_of(room_num))
+        return None if shard is None else shard.get(room_num)
+
+    def __iter__(self):
+        for building in self.buildings():
+            yield from self.shard(building)
+
+    def __len__(self):
+        return sum(self._summary(building)[ROOM_COUNT] for building in self.buildings())
+
+    def keys(self):
+        return list(self.numbers)
+
+    def values(self):
+        return list(chain.from_iterable(shard.values() for shard in self.loaded_shards()))
+
+    def items(self):
+        return list(chain.from_iterable(shard.items() for shard in self.loaded_shards()))
+
+    def page(self, start, count):
+        # تحميل المباني التي تقع فيها الصفحة فقط
+        rows = []
+        for building in self.buildings():
+            size = self._summary(building)[ROOM_COUNT]
+            if start >= size:
+                start -= size
+                continue
+            rows.extend(self.shard(building).page(start, count - len(rows)))
+            start = 0
+            if len(rows) >= count:
+                break
+        return rows
+
+    # الأعمدة الكاملة بنفس ترتيب المباني، تحمل كل المباني
+    @property
+    def numbers(self):
+        return list(chain.from_iterable(shard.numbers for shard in self.loaded_shards()))
+
+    @property
+    def names(self):
+        return list(chain.from_iterable(shard.names for shard in self.loaded_shards()))
+
+    @property
+    def has_laptop(self):
+        return array('q', chain.from_iterable(shard.has_laptop for shard in self.loaded_shards()))
+
+    @property
+    def no_laptop(self):
+        return array('q', chain.from_iterable(shard.no_laptop for shard in self.loaded_shards()))
+
+    @property
+    def balance(self):
+        return array('d', chain.from_iterable(shard.balance for shard in self.loaded_shards()))
+
+    def total_with_laptop(self):
+        return sum(self.building_totals(building)[LAPTOP_SUM] for building in self.buildings())
+
+    def total_students(self):
+        totals = [self.building_totals(building) for building in self.buildings()]
+        return sum(total[LAPTOP_SUM] + total[NO_LAPTOP_SUM] for total in totals)
+
+    def total_balance(self):
+        return sum(self.building_totals(building)[BALANCE_SUM] for building in self.buildings())
+
+    def building_totals(self, building):
+        shard = self.shards.get(building)
+        if shard is not None:
+            return shard.building_totals(building)
+        if building not in self.summaries:
+            return (0, 0, 0.0)
+        return tuple(self.summaries[building][:ROOM_COUNT])
+
+    def verify_totals(self):
+        for shard in list(self.shards.values()):
+            shard.verify_totals()
+
+    def bill_breakdown(self, student_share, laptop_share):
+        parts = [shard.bill_breakdown(student_share, laptop_share) for shard in self.loaded_shards()]
+        return tuple(array('d', chain.from_iterable(part[i] for part in parts)) for i in range(3))
+
+    def apply_bill(self, student_share, laptop_share):
+        # كل مبنى يطبق الفاتورة على جدوله
+        totals = [shard.apply_bill(student_share, laptop_share) for shard in self.loaded_shards()]
+        return array('d', chain.from_iterable(totals))
+
+
+class IndexedRoomTable:
+    # الغرف تقرأ من التخزين المفهرس عند طلبها فقط، والجدول يحتفظ بالغرف المقروءة وحدها
+    # والمجاميع = ملخص التخزين عند التشغيل - القيم الأصلية للغرف المقروءة + قيمها الحالية
+    def __init__(self, storage, lock, on_load=None):
+        self.storage = storage
+        self.lock = lock
+        self.on_load = on_load
+        self.loaded = RoomTable()
+        self.summaries = {building: list(summary) for building, summary in storage.load_summaries().items()}
+        self.base = {}
+        self.count = storage.room_count()
+        self.complete = False
+
+    def _remember(self, records):
+        # حفظ القيم الأصلية للغرف المقروءة من التخزين لطرحها من الملخص
+        for room_num, record in records.items():
+            base = self.base.setdefault(building_of(room_num), [0, 0, 0.0])
+            base[LAPTOP_SUM] += record[1]
+            base[NO_LAPTOP_SUM] += record[2]
+            base[BALANCE_SUM] += record[3]
+        self.loaded.load_records(records)
+        if self.on_load:
+            self.on_load((room_num, record[3]) for room_num, record in records.items())
+
+    def get(self, room_num):
+        room = self.loaded.get(room_num)
+        if room is not None or self.complete:
+            return room
+        with self.lock:
+            room = self.loaded.get(room_num)
+            if room is None:
+                record = self.storage.read_room(room_num)
+                if record is None:
+                    return None
+                self._remember({room_num: record})
+                room = self.loaded[room_num]
+            return room
+
+    def __contains__(self, room_num):
+        return self.get(room_num) is not None
+
+    def __getitem__(self, room_num):
+        room = self.get(room_num)
+        if room is None:
+            raise KeyError(room_num)
+        return room
+
+    def load_all(self):
+        with self.lock:
+            if self.complete:
+                return
+            batch = {}
+            for room_num, record in self.storage.iter_records():
+                if room_num in self.loaded:
+                    continue
+                batch[room_num] = record
+                if len(batch) >= 1000:
+                    self._remember(batch)
+                    batch = {}
+            self._remember(batch)
+            self.complete = True
+
+    def load_records(self, records):
+        with self.lock:
+            for room_num in records:
+                if self.get(room_num) is None:
+                    self.count += 1
+            self.loaded.load_records(records)
+
+    def to_records(self):
+        # الغرف التي لم تقرأ لم تتغير فلا حاجة لإعادة حفظها
+        return self.loaded.to_records()
+
+    def add_room(self, room_num, name, has_laptop=0, no_laptop=0, balance=0):
+        self.load_records({room_num: [name, has_laptop, no_laptop, balance]})
+        return self.loaded[room_num]
+
+    def set_record(self, room_num, record):
+        if self.get(room_num) is None:
+            raise KeyError(room_num)
+        self.loaded.set_record(room_num, record)
+
+    def __len__(self):
+        return self.count
+
+    def page(self, start, count):
+        # أرقام الصفحة تقرأ من الفهرس ثم تقرأ سجلات هذه الغرف فقط
+        with self.lock:
+            return [(room_num, self[room_num]) for room_num in self.storage.room_numbers(start, count)]
+
+    def __iter__(self):
+        self.load_all()
+        return iter(self.loaded)
+
+    def keys(self):
+        self.load_all()
+        return self.loaded.keys()
+
+    def values(self):
+        self.load_all()
+        return self.loaded.values()
+
+    def items(self):
+        self.load_all()
+        return self.loaded.items()
+
+    # الأعمدة الكاملة تحتاج قراءة كل الغرف
+    @property
+    def numbers(self):
+        self.load_all()
+        return self.loaded.numbers
+
+    @property
+    def names(self):
+        self.load_all()
+        return self.loaded.names
+
+    @property
+    def has_laptop(self):
+        self.load_all()
+        return self.loaded.has_laptop
+
+    @property
+    def no_laptop(self):
+        self.load_all()
+        return self.loaded.no_laptop
+
+    @property
+    def balance(self):
+        self.load_all()
+        return self.loaded.balance
+
+    def building_totals(self, building):
+        summary = self.summaries.get(building, (0, 0, 0.0))
+        base = self.base.get(building, (0, 0, 0.0))
+        current = self.loaded.building_totals(building)
+        return tuple(summary[i] - base[i] + current[i] for i in (LAPTOP_SUM, NO_LAPTOP_SUM, BALANCE_SUM))
+
+    def _all_totals(self):
+        return [self.building_totals(building) for building in set(self.summaries) | set(self.loaded.buildings)]
+
+    def total_with_laptop(self):
+        return sum(total[LAPTOP_SUM] for total in self._all_totals())
+
+    def total_students(self):
+        return sum(total[LAPTOP_SUM] + total[NO_LAPTOP_SUM] for total in self._all_totals())
+
+    def total_balance(self):
+        return sum(total[BALANCE_SUM] for total in self._all_totals())
+
+    def verify_totals(self):
+        self.loaded.verify_totals()
+
+    def bill_breakdown(self, student_share, laptop_share):
+        self.load_all()
+        return self.loaded.bill_breakdown(student_share, laptop_share)
+
+    def apply_bill(self, student_share, laptop_share):
+        self.load_all()
+        return self.loaded.apply_bill(student_share, laptop_share)
@@ -0,0 +1,123 @@
+import math
+from array import array
+from itertools import repeat
+from operator import add, eq, mul
+
+from room_table import building_of
+
+# نسبة الفاتورة الموزعة بالتساوي على جميع الطلاب في النظام الحالي، والباقي على أصحاب الأجهزة
+DEFAULT_STUDENT_RATIO = 50
+
+
+class Scenario:
+    # فاتورة مقترحة: المبلغ، ونسبة الجزء الموزع على جميع الطلاب من 100، ومبنى واحد أو None لكل المباني
+    __slots__ = ("amount", "student_ratio", "building")
+
+    def __init__(self, amount, student_ratio=DEFAULT_STUDENT_RATIO, building=None):
+        self.amount = float(amount)
+        self.student_ratio = float(student_ratio)
+        self.building = building
+        if not math.isfinite(self.amount):
+            raise ValueError('قيم الفواتير والنسب يجب أن تكون رقمية')
+        if self.amount < 0:
+            raise ValueError('قيمة الفاتورة لا يمكن أن تكون سالبة')
+        if not 0 <= self.student_ratio <= 100:
+            raise ValueError('نسبة التوزيع يجب أن تكون بين 0 و 100')
+
+    @property
+    def label(self):
+        label = f"{self.amount:g} ({self.student_ratio:g}/{100 - self.student_ratio:g})"
+        if self.building is not None:
+            label += f" مبنى {self.building}"
+        return label
+
+    def shares(self, total_students, total_with_laptop):
+        # (حصة الطالب، حصة صاحب الجهاز) بنفس طريقة calculate_bill مع نسبة التوزيع المختارة
+        student_part = self.amount * self.student_ratio / 100
+        student_share = student_part / total_students if total_students > 0 else 0
+        laptop_share = (self.amount - student_part) / total_with_laptop if total_with_laptop > 0 else 0
+        return student_share, laptop_share
+
+
+def parse_scenarios(amounts, ratios=None):
+    # amounts: نصوص مثل "12000" لكل المباني أو "2:4000" لمبنى واحد، وكل مبلغ يقارن مع كل نسبة
+    try:
+        ratios = [float(ratio) for ratio in ratios or [DEFAULT_STUDENT_RATIO]]
+        bills = []
+        for text in amounts:
+            building, _, amount = str(text).strip().rpartition(":")
+            bills.append((float(amount), building.strip() or None))
+    except ValueError:
+        raise ValueError('قيم الفواتير والنسب يجب أن تكون رقمية')
+    return [Scenario(amount, ratio, building) for amount, building in bills for ratio in ratios]
+
+
+class ScenarioMatrix:
+    # نتيجة المقارنة: عمود لكل سيناريو فيه حصة كل غرفة، بنفس ترتيب الغرف
+    def __init__(self, scenarios, numbers, shares, charges):
+        self.scenarios = scenarios
+        self.numbers = numbers
+        self.shares = shares
+        self.charges = charges
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def rows(self, start=0, count=None):
+        # (رقم الغرفة، [حصتها في كل سيناريو]) لكل غرفة
+        end = len(self.numbers) if count is None else min(start + count, len(self.numbers))
+        for row in range(start, end):
+            yield self.numbers[row], [column[row] for column in self.charges]
+
+    def summary(self):
+        # سطر لكل سيناريو بالحصص ومجموع ما يضاف وأعلى حصة غرفة
+        return [
+            {
+                "scenario": scenario.label,
+                "amount": scenario.amount,
+                "student_ratio": scenario.student_ratio,
+                "building": scenario.building,
+                "student_share": student_share,
+                "laptop_share": laptop_share,
+                "total": sum(column),
+                "max_room": max(column, default=0.0),
+                "rooms_charged": len(column) - column.count(0.0),
+            }
+            for scenario, (student_share, laptop_share), column in zip(self.scenarios, self.shares, self.charges)
+        ]
+
+
+def evaluate_scenarios(rooms, scenarios):
+    # حصة كل غرفة في كل سيناريو بدون تعديل الغرف: حصة الغرفة = طلابها × حصة الطالب + أصحاب الأجهزة × حصة الجهاز
+    # فأعمدة عدد الطلاب تحسب مرة واحدة، وكل سيناريو عمليتان على الأعمدة كاملة
+    # ويرفع ValueError إذا كان مبنى السيناريو بدون غرف حتى لا تظهر حصص صفرية كأنها نتيجة صحيحة
+    numbers = list(rooms.numbers)
+    has_laptop = array('q', rooms.has_laptop)
+    students = array('q', map(add, has_laptop, rooms.no_laptop))
+
+    masks = {}
+    shares = []
+    charges = []
+    for scenario in scenarios:
+        if scenario.building is None:
+            total_with_laptop = rooms.total_with_laptop()
+            total_students = rooms.total_students()
+        else:
+            laptop_sum, no_laptop_sum = rooms.building_totals(scenario.building)[:2]
+            total_with_laptop = laptop_sum
+            total_students = laptop_sum + no_laptop_sum
+        student_share, laptop_share = scenario.shares(total_students, total_with_laptop)
+        shares.append((student_share, laptop_share))
+
+        column = array('d', map(add, map(mul, students, repeat(student_share)),
+                                map(mul, has_laptop, repeat(laptop_share))))
+        if scenario.building is not None:
+            # غرف المباني الأخرى لا يضاف عليها شيء
+            mask = masks.get(scenario.building)
+            if mask is None:
+                mask = masks[scenario.building] = list(map(eq, map(building_of, numbers), repeat(scenario.building)))
+            if not any(mask):
+                raise ValueError(f'لا توجد غرف في المبنى {scenario.building}')
+            column = array('d', map(mul, column, mask))
+        charges.append(column)
+    return ScenarioMatrix(scenarios, numbers, shares, charges)
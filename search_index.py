@@ -0,0 +1,234 @@
+import heapq
+import re
+from bisect import bisect_left, insort
+from itertools import islice
+
+# عدد النتائج المعادة افتراضياً لكل بحث
+SEARCH_RESULTS_LIMIT = 10
+
+# أقصى عدد من الكلمات المفهرسة التي تبدأ بنفس البادئة يؤخذ لكل كلمة في البحث
+PREFIX_TOKENS_LIMIT = 50
+
+# أقصى عدد من الغرف المرشحة التي تقيم في كل بحث حتى يبقى زمن البحث محدوداً في القوائم الكبيرة
+CANDIDATES_LIMIT = 500
+
+# أقل طول للكلمة حتى يبحث عن كلمات قريبة منها بخطأ إملائي واحد
+FUZZY_MIN_LENGTH = 3
+
+# درجات المطابقة لكل كلمة في البحث
+EXACT_SCORE, PREFIX_SCORE, FUZZY_SCORE = 3, 2, 1
+
+# درجات مطابقة رقم الغرفة، أعلى من أي مطابقة للأسماء
+NUMBER_EXACT_SCORE, NUMBER_PREFIX_SCORE = 100, 50
+
+# التشكيل والتطويل يحذفان، والحروف التي تكتب بأكثر من شكل توحد
+_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_LETTERS = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه",
+    # الأرقام العربية والفارسية تعامل كأرقام عادية
+    **{chr(0x0660 + i): str(i) for i in range(10)},
+    **{chr(0x06f0 + i): str(i) for i in range(10)},
+})
+_TOKEN = re.compile(r"\w+")
+
+
+def normalize(text):
+    text = str(text)
+    if text.isascii():
+        return text.lower()
+    return _DIACRITICS.sub("", text).translate(_LETTERS).lower()
+
+
+def tokenize(text):
+    # الكلمات بعد التوحيد، بدون تكرار وبنفس ترتيبها
+    return tuple(dict.fromkeys(_TOKEN.findall(normalize(text))))
+
+
+def _deletes(token):
+    # الكلمة نفسها وكل أشكالها بحذف حرف واحد، الكلمتان بينهما خطأ واحد تشتركان في شكل على الأقل
+    return {token} | {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _within_one_edit(a, b):
+    # هل يمكن الوصول من a إلى b بإضافة أو حذف أو تبديل حرف واحد أو تبادل حرفين متجاورين
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < min(len(a), len(b)) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:] or (a[i + 2:] == b[i + 2:] and a[i:i + 2] == b[i:i + 2][::-1])
+    if len(a) > len(b):
+        return a[i + 1:] == b[i:]
+    return a[i:] == b[i + 1:]
+
+
+class SearchIndex:
+    # فهرس في الذاكرة للبحث بأرقام الغرف (شجرة بادئات) وبأسماء المسؤولين (كلمات موحدة مع تصحيح خطأ واحد)
+    def __init__(self, rooms=()):
+        # شجرة البادئات: كل عقدة قاموس حرف -> عقدة، والمفتاح "" يحمل رقم الغرفة التي تنتهي عندها
+        self.trie = {}
+        # رقم الغرفة -> كلمات اسمها الموحدة، لإزالتها من الفهرس عند تغير الاسم
+        self.room_tokens = {}
+        # الكلمة -> الغرف التي تحتويها أسماؤها
+        self.token_rooms = {}
+        # الكلمات مرتبة للبحث بالبادئة
+        self.sorted_tokens = []
+        # شكل الكلمة بعد حذف حرف -> الكلمات التي تعطيه، للبحث عن الكلمات القريبة
+        self.deletes = {}
+
+        # البناء الأول دفعة واحدة ثم ترتيب الكلمات مرة واحدة بدلاً من إدراج كل كلمة في مكانها
+        for room_num, name in rooms:
+            tokens = self.room_tokens[room_num] = tokenize(name)
+            self._add_number(room_num)
+            for token in tokens:
+                self.token_rooms.setdefault(token, set()).add(room_num)
+        self.sorted_tokens = sorted(self.token_rooms)
+        for token in self.sorted_tokens:
+            for variant in _deletes(token):
+                self.deletes.setdefault(variant, set()).add(token)
+
+    def __len__(self):
+        return len(self.room_tokens)
+
+    def update(self, room_num, name):
+        # إضافة غرفة أو تحديث اسمها، تعديل الكلمات التي تغيرت فقط
+        tokens = tokenize(name)
+        old_tokens = self.room_tokens.get(room_num)
+        if old_tokens is None:
+            self._add_number(room_num)
+            old_tokens = ()
+        elif old_tokens == tokens:
+            return
+        self.room_tokens[room_num] = tokens
+
+        for token in set(old_tokens) - set(tokens):
+            self._remove_token(token, room_num)
+        for token in set(tokens) - set(old_tokens):
+            self._add_token(token, room_num)
+
+    def remove(self, room_num):
+        tokens = self.room_tokens.pop(room_num, None)
+        if tokens is None:
+            return
+        for token in tokens:
+            self._remove_token(token, room_num)
+        self._remove_number(room_num)
+
+    def _add_number(self, room_num):
+        node = self.trie
+        for char in normalize(room_num):
+            node = node.setdefault(char, {})
+        node[""] = room_num
+
+    def _remove_number(self, room_num):
+        chars = normalize(room_num)
+        path = [self.trie]
+        for char in chars:
+            path.append(path[-1][char])
+        path[-1].pop("", None)
+        # حذف العقد التي لم تعد تؤدي لأي غرفة
+        for depth in range(len(chars), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][chars[depth - 1]]
+
+    def _add_token(self, token, room_num):
+        rooms = self.token_rooms.get(token)
+        if rooms is None:
+            rooms = self.token_rooms[token] = set()
+            insort(self.sorted_tokens, token)
+            for variant in _deletes(token):
+                self.deletes.setdefault(variant, set()).add(token)
+        rooms.add(room_num)
+
+    def _remove_token(self, token, room_num):
+        rooms = self.token_rooms[token]
+        rooms.discard(room_num)
+        if rooms:
+            return
+        del self.token_rooms[token]
+        del self.sorted_tokens[bisect_left(self.sorted_tokens, token)]
+        for variant in _deletes(token):
+            tokens = self.deletes[variant]
+            tokens.discard(token)
+            if not tokens:
+                del self.deletes[variant]
+
+    def numbers_with_prefix(self, prefix, limit=SEARCH_RESULTS_LIMIT):
+        # أرقام الغرف التي تبدأ بالبادئة بترتيب أبجدي، المرور يتوقف عند الوصول للعدد المطلوب
+        node = self.trie
+        for char in normalize(prefix):
+            node = node.get(char)
+            if node is None:
+                return []
+        results = []
+        stack = [node]
+        while stack and len(results) < limit:
+            node = stack.pop()
+            if "" in node:
+                results.append(node[""])
+            stack.extend(node[char] for char in sorted(node, reverse=True) if char)
+        return results
+
+    def matching_tokens(self, token):
+        # الكلمات المفهرسة التي تطابق كلمة البحث: {الكلمة: الدرجة}
+        matches = {}
+        start = bisect_left(self.sorted_tokens, token)
+        for candidate in self.sorted_tokens[start:start + PREFIX_TOKENS_LIMIT]:
+            if not candidate.startswith(token):
+                break
+            matches[candidate] = EXACT_SCORE if candidate == token else PREFIX_SCORE
+        if len(token) >= FUZZY_MIN_LENGTH:
+            for variant in _deletes(token):
+                for candidate in self.deletes.get(variant, ()):
+                    if candidate not in matches and _within_one_edit(token, candidate):
+                        matches[candidate] = FUZZY_SCORE
+        return matches
+
+    def search(self, query, limit=SEARCH_RESULTS_LIMIT):
+        # يعيد أرقام الغرف مرتبة حسب قرب المطابقة، الرقم المطابق أولاً ثم الأسماء
+        query = normalize(query).strip()
+        if not query:
+            return []
+        scores = {}
+
+        # رقم الغرفة يبحث عنه بالبادئة
+        for room_num in self.numbers_with_prefix(query, limit):
+            scores[room_num] = NUMBER_EXACT_SCORE if normalize(room_num) == query else NUMBER_PREFIX_SCORE
+
+        # كل كلمة في البحث يجب أن تطابق كلمة في اسم الغرفة، والغرف المرشحة تؤخذ من الكلمة الأندر
+        query_tokens = tokenize(query)
+        token_matches = [self.matching_tokens(token) for token in query_tokens]
+        if token_matches and all(token_matches):
+            def size(matches):
+                return sum(len(self.token_rooms[token]) for token in matches)
+            driver = min(range(len(token_matches)), key=lambda i: size(token_matches[i]))
+
+            # درجة الغرفة من الكلمة الأندر معروفة من الكلمة التي رشحتها، والكلمات الأخرى تقيم لكل غرفة
+            candidates = {}
+            for token, score in sorted(token_matches[driver].items(), key=lambda item: (-item[1], item[0])):
+                for room_num in islice(self.token_rooms[token], CANDIDATES_LIMIT - len(candidates)):
+                    candidates.setdefault(room_num, score)
+                if len(candidates) >= CANDIDATES_LIMIT:
+                    break
+
+            others = token_matches[:driver] + token_matches[driver + 1:]
+            for room_num, score in candidates.items():
+                if others:
+                    room_tokens = self.room_tokens[room_num]
+                    for matches in others:
+                        best = max(map(matches.get, room_tokens, (0,) * len(room_tokens)))
+                        if not best:
+                            break
+                        score += best
+                    else:
+                        scores[room_num] = max(scores.get(room_num, 0), score)
+                elif score > scores.get(room_num, 0):
+                    scores[room_num] = score
+
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], len(item[0]), item[0]))
+        return [room_num for room_num, _ in ranked]
@@ -0,0 +1,107 @@
+import struct
+import sys
+import zlib
+from array import array
+
+# علامة الصيغة ورقم نسختها، النسخ غير المعروفة ترفض عند القراءة
+SNAPSHOT_MAGIC = b"ROOMSNAP"
+SNAPSHOT_VERSION = 1
+
+# خيارات الرأس
+FLAG_COMPRESSED = 1
+
+# الرأس: العلامة، النسخة، الخيارات، عدد الغرف، طول البيانات المحفوظة، CRC32 للبيانات المحفوظة
+HEADER = struct.Struct("<8sHHIQI")
+
+# أطوال جدولي النصوص داخل البيانات: أرقام الغرف ثم الأسماء
+STRING_TABLES = struct.Struct("<QQ")
+
+# مستوى الضغط، السرعة أهم من حجم الملف
+COMPRESS_LEVEL = 1
+
+
+def _column_bytes(column):
+    # الأعمدة الرقمية تحفظ بترتيب little-endian مهما كان الجهاز
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _column_from(typecode, data):
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def _string_table(values):
+    # النصوص مفصولة بـ \0 في كتلة واحدة حتى تقسم دفعة واحدة عند القراءة
+    blob = "\0".join(values).encode('utf-8')
+    if values and blob.count(b"\0") != len(values) - 1:
+        raise ValueError("النص يحتوي محرفاً غير مسموح")
+    return blob
+
+
+def columns_from_records(records):
+    # تحويل سجلات القرص {رقم الغرفة: [الاسم، مع لابتوب، بدون لابتوب، المبلغ]} إلى أعمدة
+    if not records:
+        return [], [], array('q'), array('q'), array('d')
+    names, has_laptop, no_laptop, balance = zip(*records.values())
+    return (list(records), list(names), array('q', map(int, has_laptop)), array('q', map(int, no_laptop)),
+            array('d', map(float, balance)))
+
+
+def encode_snapshot(numbers, names, has_laptop, no_laptop, balance, compress=False):
+    numbers_blob = _string_table(numbers)
+    names_blob = _string_table(names)
+    payload = b"".join((
+        STRING_TABLES.pack(len(numbers_blob), len(names_blob)),
+        numbers_blob,
+        names_blob,
+        _column_bytes(array('q', has_laptop)),
+        _column_bytes(array('q', no_laptop)),
+        _column_bytes(array('d', balance)),
+    ))
+
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload, COMPRESS_LEVEL)
+        flags |= FLAG_COMPRESSED
+    return HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, flags, len(numbers), len(payload),
+                       zlib.crc32(payload)) + payload
+
+
+def decode_snapshot(data):
+    # يعيد (أرقام الغرف، الأسماء، مع لابتوب، بدون لابتوب، المبالغ) أو ValueError إذا كانت اللقطة غير صالحة
+    if len(data) < HEADER.size:
+        raise ValueError("لقطة غير مكتملة")
+    magic, version, flags, count, length, checksum = HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("الملف ليس لقطة غرف")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"نسخة اللقطة {version} غير مدعومة")
+
+    payload = memoryview(data)[HEADER.size:HEADER.size + length]
+    if len(payload) != length or zlib.crc32(payload) != checksum:
+        raise ValueError("اللقطة تالفة")
+    if flags & FLAG_COMPRESSED:
+        payload = memoryview(zlib.decompress(payload))
+
+    numbers_length, names_length = STRING_TABLES.unpack_from(payload)
+    position = STRING_TABLES.size
+    numbers = bytes(payload[position:position + numbers_length]).decode('utf-8').split("\0") if count else []
+    position += numbers_length
+    names = bytes(payload[position:position + names_length]).decode('utf-8').split("\0") if count else []
+    position += names_length
+
+    columns = []
+    for typecode in ('q', 'q', 'd'):
+        size = array(typecode).itemsize * count
+        columns.append(_column_from(typecode, payload[position:position + size]))
+        position += size
+
+    if len(numbers) != count or len(names) != count or any(len(column) != count for column in columns):
+        raise ValueError("اللقطة تالفة")
+    return (numbers, names, *columns)
@@ -0,0 +1,837 @@
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from instrumentation import bytes_written, timed
+from room_table import LAPTOP_SUM, NO_LAPTOP_SUM, BALANCE_SUM, ROOM_COUNT, RoomTable, building_of
+from snapshot import columns_from_records, decode_snapshot, encode_snapshot
+
+# عدد التعديلات المسجلة في ملف السجل قبل دمجها في لقطة كاملة
+JOURNAL_COMPACT_THRESHOLD = 200
+
+# مدة الانتظار بالثواني لتجميع التعديلات المتتالية في كتابة واحدة
+SAVE_DELAY = 0.2
+
+# مدة الانتظار قبل إعادة المحاولة إذا فشلت الكتابة
+SAVE_RETRY_DELAY = 2.0
+
+# ضغط اللقطة الثنائية، يصغر الملف مقابل وقت إضافي عند الحفظ والتحميل
+SNAPSHOT_COMPRESS = os.environ.get("ROOMS_SNAPSHOT_COMPRESS") == "1"
+
+# عدد السجلات المضافة بعد آخر فهرسة قبل إعادة كتابة ملف البيانات والفهرس
+INDEX_COMPACT_THRESHOLD = 1000
+
+# رأس ملف الفهرس: علامة الصيغة، نسخة ملف البيانات، عدد الغرف، نهاية البيانات المفهرسة، طول رقم الغرفة
+INDEX_MAGIC = b"ROOMIDX1"
+INDEX_HEADER = struct.Struct("<8sQQQI")
+
+
+def write_json_atomic(filename, data):
+    # كتابة الملف كاملاً في ملف مؤقت ثم استبدال الملف الأصلي دفعة واحدة
+    temp_file = filename + ".tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        bytes_written(os.fstat(f.fileno()).st_size)
+        os.fsync(f.fileno())
+    os.replace(temp_file, filename)
+
+
+def write_bytes_atomic(filename, data):
+    temp_file = filename + ".tmp"
+    with open(temp_file, 'wb') as f:
+        f.write(data)
+        f.flush()
+        bytes_written(len(data))
+        os.fsync(f.fileno())
+    os.replace(temp_file, filename)
+
+
+class JsonStorage:
+    # التخزين في ملف JSON مع سجل إضافي للتعديلات الصغيرة
+    def __init__(self, data_file="rooms_data.json", journal_file="rooms_data.journal",
+                 ledger_file="rooms_ledger.jsonl"):
+        self.data_file = data_file
+        self.journal_file = journal_file
+        self.ledger_file = ledger_file
+        self.journal_entries = 0
+
+    def load(self):
+        # الملف الموجود التالف يرفع ValueError ولا يكتب فوقه حتى يمكن استعادته
+        # والبيانات الافتراضية تستخدم فقط إذا لم يوجد الملف
+        records = None
+        if os.path.exists(self.data_file):
+            try:
+                with open(self.data_file, 'r', encoding='utf-8') as f:
+                    records = json.load(f)
+            except (OSError, ValueError) as e:
+                raise ValueError(f"تعذر قراءة ملف البيانات {self.data_file}: {e}")
+            if not isinstance(records, dict):
+                raise ValueError(f"تعذر قراءة ملف البيانات {self.data_file}")
+
+        # إعادة تطبيق التعديلات المسجلة بعد آخر لقطة
+        journal, damaged = self.read_journal()
+        if journal is not None:
+            if records is None:
+                records = {}
+            records.update(journal)
+
+        if damaged:
+            self.save(records)
+        return records
+
+    def read_journal(self):
+        # يعيد (آخر حالة لكل غرفة في السجل أو None إذا لم يوجد السجل، هل وجد سطر تالف)
+        self.journal_entries = 0
+        if not os.path.exists(self.journal_file):
+            return None, False
+        records = {}
+        damaged = False
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    room_num, record = json.loads(line)
+                except (ValueError, TypeError):
+                    # سطر غير مكتمل بسبب انقطاع أثناء الكتابة
+                    damaged = True
+                    continue
+                records[room_num] = record
+                self.journal_entries += 1
+        return records, damaged
+
+    def snapshot(self, rooms):
+        # نسخة من كل الغرف بالصيغة التي يحفظها save
+        return rooms.to_records()
+
+    def save(self, records):
+        # كتابة لقطة كاملة في ملف مؤقت ثم استبدال الملف الأصلي دفعة واحدة
+        try:
+            write_json_atomic(self.data_file, records)
+
+            # اللقطة تحتوي كل التعديلات فيمكن تفريغ السجل
+            open(self.journal_file, 'w', encoding='utf-8').close()
+            self.journal_entries = 0
+            return True
+        except:
+            return False
+
+    def needs_snapshot(self, has_bills, changed=0):
+        # الفاتورة تعدل كل الغرف لذلك تحفظ كلقطة كاملة، وكذلك عند امتلاء السجل
+        # أو عندما تكون التعديلات المجمعة كبيرة بحيث تكون اللقطة أصغر من إضافتها للسجل
+        return has_bills or self.journal_entries + changed >= JOURNAL_COMPACT_THRESHOLD
+
+    def load_ledger(self):
+        if not os.path.exists(self.ledger_file):
+            return
+        with open(self.ledger_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    at, room_num, kind, amount = json.loads(line)
+                except (ValueError, TypeError):
+                    continue
+                yield at, room_num, kind, amount
+
+    def append_ledger(self, entries):
+        # قيود السجل تضاف فقط ولا تدخل في اللقطة
+        if not entries:
+            return True
+        try:
+            with open(self.ledger_file, 'a', encoding='utf-8') as f:
+                start = os.fstat(f.fileno()).st_size
+                f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+                f.flush()
+                bytes_written(os.fstat(f.fileno()).st_size - start)
+                os.fsync(f.fileno())
+            return True
+        except:
+            return False
+
+    def commit(self, records, bills, snapshot=None, ledger_entries=()):
+        # حالة الغرف تكتب أولاً لأن إعادة كتابتها عند الفشل لا تكرر شيئاً، أما قيود السجل فتضاف مرة واحدة
+        if not self.write_records(records, snapshot):
+            return False
+        return self.append_ledger(ledger_entries)
+
+    def write_records(self, records, snapshot):
+        if snapshot is not None:
+            return self.save(snapshot)
+
+        # إضافة الحالة الجديدة للغرف في نهاية السجل بكتابة واحدة بدلاً من إعادة كتابة الملف كاملاً
+        if not records:
+            return True
+        lines = "".join(
+            json.dumps([room_num, record], ensure_ascii=False) + "\n" for room_num, record in records.items()
+        )
+        try:
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                start = os.fstat(f.fileno()).st_size
+                f.write(lines)
+                f.flush()
+                bytes_written(os.fstat(f.fileno()).st_size - start)
+                os.fsync(f.fileno())
+            self.journal_entries += len(records)
+            return True
+        except:
+            return False
+
+    def close(self):
+        pass
+
+
+class BinaryStorage(JsonStorage):
+    # لقطة ثنائية بأعمدة رقمية ثابتة الطول وجدول نصوص للأسماء، مع نفس سجل التعديلات المستخدم في JSON
+    def __init__(self, data_file="rooms_data.bin", journal_file="rooms_data.journal", migrate_from="rooms_data.json",
+                 compress=SNAPSHOT_COMPRESS, ledger_file="rooms_ledger.jsonl"):
+        super().__init__(data_file, journal_file, ledger_file)
+        self.migrate_from = migrate_from
+        self.compress = compress
+
+    def read_snapshot(self):
+        # يعيد (الأعمدة، هل أخذت من ملف JSON)، وملف JSON القديم يستخدم فقط إذا لم توجد لقطة ثنائية
+        # اللقطة الموجودة التالفة ترفع ValueError ولا يكتب فوقها حتى يمكن استعادتها
+        if os.path.exists(self.data_file):
+            try:
+                with open(self.data_file, 'rb') as f:
+                    return decode_snapshot(f.read()), False
+            except (ValueError, struct.error, zlib.error) as e:
+                raise ValueError(f"تعذر قراءة ملف البيانات {self.data_file}: {e}")
+        if self.migrate_from and os.path.exists(self.migrate_from):
+            try:
+                with open(self.migrate_from, 'r', encoding='utf-8') as f:
+                    return columns_from_records(json.load(f)), True
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                raise ValueError(f"تعذر قراءة ملف البيانات {self.migrate_from}: {e}")
+        return None, False
+
+    def load_table(self):
+        columns, migrated = self.read_snapshot()
+        journal, damaged = self.read_journal()
+        if columns is None and journal is None:
+            return None
+
+        table = RoomTable()
+        if columns is not None:
+            table.load_columns(*columns)
+        if journal:
+            table.load_records(journal)
+
+        # تحويل البيانات للصيغة الثنائية مباشرة بعد قراءتها من JSON أو من سجل تالف
+        if migrated or damaged:
+            self.save(table.to_columns())
+        return table
+
+    def load(self):
+        table = self.load_table()
+        return None if table is None else table.to_records()
+
+    def save(self, records):
+        # records إما سجلات القرص أو أعمدة الجدول كما يعيدها snapshot
+        columns = columns_from_records(records) if isinstance(records, dict) else records
+        try:
+            write_bytes_atomic(self.data_file, encode_snapshot(*columns, compress=self.compress))
+            open(self.journal_file, 'w', encoding='utf-8').close()
+            self.journal_entries = 0
+            return True
+        except:
+            return False
+
+    def snapshot(self, rooms):
+        return rooms.to_columns()
+
+
+class ShardedJsonStorage(JsonStorage):
+    # كل مبنى في ملف مستقل، وملف الفهرس يحتوي مجاميع كل مبنى حتى لا تحمل كل المباني عند التشغيل
+    def __init__(self, directory="rooms_shards", migrate_from="rooms_data.json", ledger_file="rooms_ledger.jsonl"):
+        self.directory = directory
+        self.migrate_from = migrate_from
+        self.ledger_file = ledger_file
+        self.index_file = os.path.join(directory, "index.json")
+        self.summaries = None
+
+    def shard_file(self, building):
+        name = building if building.isalnum() else building.encode('utf-8').hex()
+        return os.path.join(self.directory, f"building_{name}.json")
+
+    def load_summaries(self):
+        # {المبنى: [مع لابتوب، بدون لابتوب، المبلغ المتراكم، عدد الغرف]}
+        if self.summaries is None:
+            if os.path.exists(self.index_file):
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    self.summaries = json.load(f)
+            else:
+                self.summaries = {}
+                # تقسيم ملف JSON القديم على المباني عند أول تشغيل بهذا التخزين
+                if self.migrate_from and os.path.exists(self.migrate_from):
+                    records = JsonStorage(self.migrate_from).load()
+                    if records:
+                        self.save(records)
+        return self.summaries
+
+    def load_building(self, building):
+        try:
+            with open(self.shard_file(building), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def load(self):
+        records = {}
+        for building in self.load_summaries():
+            records.update(self.load_building(building))
+        return records or None
+
+    def save(self, records):
+        # كل مبنى معدل يعاد كتابة ملفه فقط مع تحديث مجاميعه في الفهرس
+        groups = {}
+        for room_num, record in records.items():
+            groups.setdefault(building_of(room_num), {})[room_num] = record
+        summaries = dict(self.load_summaries())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            for building, group in groups.items():
+                shard = self.load_building(building)
+                shard.update(group)
+                write_json_atomic(self.shard_file(building), shard)
+
+                summary = [0, 0, 0.0, len(shard)]
+                for name, has_laptop, no_laptop, balance in shard.values():
+                    summary[LAPTOP_SUM] += has_laptop
+                    summary[NO_LAPTOP_SUM] += no_laptop
+                    summary[BALANCE_SUM] += balance
+                summaries[building] = summary
+            write_json_atomic(self.index_file, summaries)
+            self.summaries = summaries
+            return True
+        except:
+            return False
+
+    def needs_snapshot(self, has_bills, changed=0):
+        # الفاتورة تعدل كل الغرف المحملة، والتعديلات الصغيرة تكتب ملف مبناها فقط
+        return has_bills
+
+    def write_records(self, records, snapshot):
+        if snapshot is None and not records:
+            return True
+        return self.save(snapshot if snapshot is not None else records)
+
+
+class IndexedStorage(JsonStorage):
+    # سجلات الغرف سطوراً في ملف بيانات، وفهرس مرتب (رقم الغرفة -> موضع السجل) يقرأ عبر mmap
+    # بحيث تقرأ الغرفة المطلوبة فقط، والتعديلات تضاف في نهاية ملف البيانات حتى إعادة الفهرسة
+    def __init__(self, name="rooms_data", migrate_from="rooms_data.json", ledger_file="rooms_ledger.jsonl"):
+        self.name = name
+        self.index_file = name + ".idx"
+        self.summary_file = name + ".summary.json"
+        self.migrate_from = migrate_from
+        self.ledger_file = ledger_file
+        self.lock = threading.RLock()
+        self.index_map = None
+        self.data_map = None
+        self.generation = 0
+        self.count = 0
+        self.overlay = {}
+        self.new_rooms = []
+
+        with self.lock:
+            if not os.path.exists(self.index_file):
+                records = None
+                if self.migrate_from and os.path.exists(self.migrate_from):
+                    records = JsonStorage(self.migrate_from).load()
+                self.rewrite(records or {})
+            else:
+                self._map()
+
+    def data_path(self, generation):
+        return f"{self.name}.{generation}.rec"
+
+    def _unmap(self):
+        for current in (self.index_map, self.data_map):
+            if current is not None:
+                current.close()
+        self.index_map = self.data_map = None
+
+    def _map_data(self):
+        if self.data_map is not None:
+            self.data_map.close()
+            self.data_map = None
+        with open(self.data_path(self.generation), 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self.data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _map(self):
+        # فتح الفهرس وملف البيانات، وقراءة السجلات المضافة بعد آخر فهرسة فقط
+        self._unmap()
+        with open(self.index_file, 'rb') as f:
+            self.index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.generation, self.count, self.data_end, key_size = INDEX_HEADER.unpack_from(self.index_map, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError("ملف فهرس غير صالح")
+        self.key_size = key_size
+        self.entry = struct.Struct(f"<{key_size}sQI")
+        self._map_data()
+
+        summary = None
+        try:
+            with open(self.summary_file, 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if summary and summary.get("generation") != self.generation:
+            summary = None
+        self._scan_tail(summary)
+
+    def _scan_tail(self, summary):
+        # السجلات بعد نهاية الفهرس تحفظ مواضعها في الذاكرة، وما بعد آخر ملخص تحدث مجاميعه
+        self.overlay = {}
+        self.new_rooms = []
+        buildings = summary["buildings"] if summary else None
+        summary_end = summary["end"] if summary else 0
+        path = self.data_path(self.generation)
+        position = self.data_end
+        with open(path, 'rb') as f:
+            f.seek(position)
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError
+                    room_num, name, has_laptop, no_laptop, balance = json.loads(line)
+                except (ValueError, TypeError):
+                    break
+                if buildings is not None and position >= summary_end:
+                    self._count_change(buildings, room_num, self.read_room(room_num),
+                                       [name, has_laptop, no_laptop, balance])
+                self._set_location(room_num, position, len(line))
+                position += len(line)
+
+        # سطر غير مكتمل بسبب انقطاع أثناء الكتابة
+        if position < os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(position)
+            self._map_data()
+
+        if buildings is None:
+            buildings = {}
+            for room_num, record in self.iter_records():
+                self._count_change(buildings, room_num, None, record)
+        self.summary = {"generation": self.generation, "end": position, "buildings": buildings}
+
+    def _count_change(self, buildings, room_num, old, new):
+        summary = buildings.setdefault(building_of(room_num), [0, 0, 0.0, 0])
+        if old is None:
+            summary[ROOM_COUNT] += 1
+        else:
+            summary[LAPTOP_SUM] -= old[1]
+            summary[NO_LAPTOP_SUM] -= old[2]
+            summary[BALANCE_SUM] -= old[3]
+        summary[LAPTOP_SUM] += new[1]
+        summary[NO_LAPTOP_SUM] += new[2]
+        summary[BALANCE_SUM] += new[3]
+
+    def _set_location(self, room_num, offset, length):
+        if room_num not in self.overlay and self._find_base(room_num) is None:
+            self.new_rooms.append(room_num)
+        self.overlay[room_num] = (offset, length)
+
+    def _key_at(self, i):
+        start = INDEX_HEADER.size + i * self.entry.size
+        return self.index_map[start:start + self.key_size].rstrip(b"\0").decode('utf-8')
+
+    def _find_base(self, room_num):
+        # بحث ثنائي في الفهرس المرتب داخل الملف بدون تحميله، والرقم غير النصي ليس غرفة
+        if not isinstance(room_num, str):
+            return None
+        key = room_num.encode('utf-8')
+        if len(key) > self.key_size:
+            return None
+        key = key.ljust(self.key_size, b"\0")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            start = INDEX_HEADER.size + middle * self.entry.size
+            if self.index_map[start:start + self.key_size] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            found, offset, length = self.entry.unpack_from(self.index_map, INDEX_HEADER.size + low * self.entry.size)
+            if found == key:
+                return offset, length
+        return None
+
+    def _read(self, offset, length):
+        return json.loads(self.data_map[offset:offset + length])[1:]
+
+    def read_room(self, room_num):
+        with self.lock:
+            location = self.overlay.get(room_num) or self._find_base(room_num)
+            return None if location is None else self._read(*location)
+
+    def room_count(self):
+        return self.count + len(self.new_rooms)
+
+    def room_numbers(self, start, count):
+        # أرقام الغرف بترتيب الفهرس ثم الغرف المضافة بعده
+        with self.lock:
+            numbers = [self._key_at(i) for i in range(start, min(start + count, self.count))]
+            extra = max(0, start - self.count)
+            numbers.extend(self.new_rooms[extra:extra + count - len(numbers)])
+            return numbers
+
+    def iter_locations(self):
+        # (رقم الغرفة، (الموضع، الطول)) لكل الغرف بترتيب الفهرس ثم الغرف المضافة بعده
+        with self.lock:
+            for i in range(self.count):
+                room_num = self._key_at(i)
+                location = self.overlay.get(room_num)
+                if location is None:
+                    location = self.entry.unpack_from(self.index_map, INDEX_HEADER.size + i * self.entry.size)[1:]
+                yield room_num, location
+            for room_num in list(self.new_rooms):
+                yield room_num, self.overlay[room_num]
+
+    def iter_records(self):
+        for room_num, location in self.iter_locations():
+            yield room_num, self._read(*location)
+
+    def load_summaries(self):
+        return self.summary["buildings"]
+
+    def load(self):
+        return dict(self.iter_records()) or None
+
+    def save(self, records):
+        with self.lock:
+            try:
+                if len(self.overlay) + len(records) >= INDEX_COMPACT_THRESHOLD:
+                    self.rewrite(records)
+                else:
+                    self._append(records)
+                return True
+            except:
+                return False
+
+    def _append(self, records):
+        # إضافة الحالة الجديدة للغرف في نهاية ملف البيانات ثم تحديث الملخص
+        if not records:
+            return
+        old_records = [self.read_room(room_num) for room_num in records]
+        lines = [
+            json.dumps([room_num] + list(record), ensure_ascii=False).encode('utf-8') + b"\n"
+            for room_num, record in records.items()
+        ]
+        path = self.data_path(self.generation)
+        with open(path, 'ab') as f:
+            position = f.seek(0, os.SEEK_END)
+            f.write(b"".join(lines))
+            f.flush()
+            bytes_written(sum(map(len, lines)))
+            os.fsync(f.fileno())
+        self._map_data()
+
+        buildings = self.summary["buildings"]
+        for (room_num, record), old, line in zip(records.items(), old_records, lines):
+            self._count_change(buildings, room_num, old, record)
+            self._set_location(room_num, position, len(line))
+            position += len(line)
+        self.summary["end"] = position
+        write_json_atomic(self.summary_file, self.summary)
+
+    def rewrite(self, updates):
+        # كتابة كل الغرف في ملف بيانات جديد مع فهرس مرتب جديد، واستبدال الفهرس آخراً يجعل الملف الجديد هو المعتمد
+        generation = self.generation + 1
+        path = self.data_path(generation)
+        entries = []
+        buildings = {}
+        position = 0
+
+        def merged():
+            # السجلات القديمة التي لها حالة جديدة لا تقرأ من الملف
+            remaining = dict(updates)
+            if self.index_map is not None:
+                for room_num, location in self.iter_locations():
+                    record = remaining.pop(room_num, None)
+                    yield room_num, record if record is not None else self._read(*location)
+            yield from remaining.items()
+
+        with open(path, 'wb') as f:
+            for room_num, record in merged():
+                line = json.dumps([room_num] + list(record), ensure_ascii=False).encode('utf-8') + b"\n"
+                f.write(line)
+                entries.append((room_num.encode('utf-8'), position, len(line)))
+                position += len(line)
+                self._count_change(buildings, room_num, None, record)
+            f.flush()
+            bytes_written(position)
+            os.fsync(f.fileno())
+
+        entries.sort()
+        key_size = max([len(entry[0]) for entry in entries] + [8])
+        entry = struct.Struct(f"<{key_size}sQI")
+        temp_file = self.index_file + ".tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, generation, len(entries), position, key_size))
+            f.write(b"".join(entry.pack(*item) for item in entries))
+            f.flush()
+            bytes_written(INDEX_HEADER.size + entry.size * len(entries))
+            os.fsync(f.fileno())
+        write_json_atomic(self.summary_file, {"generation": generation, "end": position, "buildings": buildings})
+
+        old_path = self.data_path(self.generation)
+        self._unmap()
+        os.replace(temp_file, self.index_file)
+        if self.generation and os.path.exists(old_path):
+            os.remove(old_path)
+        self._map()
+
+    def needs_snapshot(self, has_bills, changed=0):
+        return has_bills
+
+    def write_records(self, records, snapshot):
+        if snapshot is None and not records:
+            return True
+        return self.save(snapshot if snapshot is not None else records)
+
+    def close(self):
+        with self.lock:
+            self._unmap()
+
+
+class SqliteStorage:
+    # التخزين في قاعدة SQLite بحيث يكون كل تعديل جملة واحدة مفهرسة
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rooms (
+            room_num TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            has_laptop INTEGER NOT NULL DEFAULT 0,
+            no_laptop INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS balances (
+            room_num TEXT PRIMARY KEY REFERENCES rooms(room_num) ON DELETE CASCADE,
+            balance REAL NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS bills (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            applied_at TEXT NOT NULL,
+            student_share REAL NOT NULL,
+            laptop_share REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            at REAL NOT NULL,
+            room_num TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            amount REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_ledger_room_at ON ledger(room_num, at);
+        -- رقم الغرفة مفهرس لأنه المفتاح الأساسي
+        CREATE INDEX IF NOT EXISTS idx_rooms_name ON rooms(name);
+        CREATE INDEX IF NOT EXISTS idx_balances_balance ON balances(balance);
+    """
+
+    def __init__(self, db_file="rooms_data.db", migrate_from="rooms_data.json"):
+        self.db_file = db_file
+        self.migrate_from = migrate_from
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(self.SCHEMA)
+
+    def load(self):
+        rows = self.conn.execute(
+            "SELECT r.room_num, r.name, r.has_laptop, r.no_laptop, COALESCE(b.balance, 0) "
+            "FROM rooms r LEFT JOIN balances b ON b.room_num = r.room_num"
+        ).fetchall()
+        if rows:
+            return {row[0]: [row[1], row[2], row[3], row[4]] for row in rows}
+
+        # نقل البيانات من ملف JSON عند أول تشغيل بهذا التخزين
+        if self.migrate_from and os.path.exists(self.migrate_from):
+            records = JsonStorage(self.migrate_from).load()
+            if records:
+                self.save(records)
+                return records
+        return None
+
+    def save(self, records):
+        try:
+            with self.conn:
+                self._upsert(records)
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _upsert(self, records):
+        self.conn.executemany(
+            "INSERT INTO rooms (room_num, name, has_laptop, no_laptop) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(room_num) DO UPDATE SET name = excluded.name, "
+            "has_laptop = excluded.has_laptop, no_laptop = excluded.no_laptop",
+            [(room_num, record[0], record[1], record[2]) for room_num, record in records.items()]
+        )
+        self.conn.executemany(
+            "INSERT INTO balances (room_num, balance) VALUES (?, ?) "
+            "ON CONFLICT(room_num) DO UPDATE SET balance = excluded.balance",
+            [(room_num, record[3]) for room_num, record in records.items()]
+        )
+
+    def needs_snapshot(self, has_bills, changed=0):
+        return False
+
+    def snapshot(self, rooms):
+        return rooms.to_records()
+
+    def load_ledger(self):
+        return self.conn.execute("SELECT at, room_num, kind, amount FROM ledger ORDER BY id").fetchall()
+
+    def commit(self, records, bills, snapshot=None, ledger_entries=()):
+        # كل التعديلات المجمعة في معاملة واحدة: الفواتير أولاً ثم الحالة الأخيرة للغرف المعدلة
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO ledger (at, room_num, kind, amount) VALUES (?, ?, ?, ?)",
+                    ledger_entries
+                )
+                for student_share, laptop_share, applied_at in bills:
+                    self.conn.execute(
+                        "UPDATE balances SET balance = balance + ("
+                        "SELECT (r.has_laptop + r.no_laptop) * ? + r.has_laptop * ? "
+                        "FROM rooms r WHERE r.room_num = balances.room_num)",
+                        (student_share, laptop_share)
+                    )
+                    self.conn.execute(
+                        "INSERT INTO bills (applied_at, student_share, laptop_share) VALUES (?, ?, ?)",
+                        (applied_at, student_share, laptop_share)
+                    )
+                self._upsert(snapshot if snapshot is not None else records)
+            return True
+        except sqlite3.Error:
+            return False
+
+    def close(self):
+        self.conn.close()
+
+
+class BackgroundWriter:
+    # حفظ التعديلات في خيط منفصل حتى لا تنتظر الواجهة القرص
+    def __init__(self, storage, rooms, lock, delay=SAVE_DELAY):
+        self.storage = storage
+        self.rooms = rooms
+        self.lock = lock
+        self.delay = delay
+
+        # التعديلات التي لم تكتب بعد
+        self.dirty = set()
+        self.bills = []
+        self.ledger_entries = []
+        self.full = False
+
+        # عدد التعديلات المطلوبة وعدد ما كتب منها فعلاً
+        self.submitted = 0
+        self.written = 0
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # الدوال التالية تستدعى داخل قفل مدير الغرف بعد تعديل الذاكرة
+    def mark_room(self, room_num):
+        with self.condition:
+            self.dirty.add(room_num)
+            self.submitted += 1
+            self.condition.notify_all()
+
+    def mark_rooms(self, room_nums):
+        # عدة غرف معدلة في عملية واحدة تحسب كتعديل واحد
+        with self.condition:
+            self.dirty.update(room_nums)
+            self.submitted += 1
+            self.condition.notify_all()
+
+    def mark_bill(self, student_share, laptop_share):
+        with self.condition:
+            self.bills.append((student_share, laptop_share, datetime.now().isoformat(timespec='seconds')))
+            self.submitted += 1
+            self.condition.notify_all()
+
+    def mark_ledger(self, entries):
+        if not entries:
+            return
+        with self.condition:
+            self.ledger_entries.extend(entries)
+            self.submitted += 1
+            self.condition.notify_all()
+
+    def mark_all(self):
+        with self.condition:
+            self.full = True
+            self.submitted += 1
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.written >= self.submitted:
+                    self.condition.wait()
+
+            # انتظار قصير حتى تتجمع التعديلات المتتالية ثم كتابتها مرة واحدة
+            time.sleep(self.delay)
+            if not self.write_pending():
+                time.sleep(SAVE_RETRY_DELAY)
+
+    @timed("storage.commit")
+    def write_pending(self):
+        with self.write_lock:
+            # أخذ نسخة من التعديلات المعلقة وحالة الغرف في لحظة واحدة
+            with self.lock:
+                with self.condition:
+                    dirty, bills, full, target = self.dirty, self.bills, self.full, self.submitted
+                    ledger_entries = self.ledger_entries
+                    self.dirty, self.bills, self.ledger_entries, self.full = set(), [], [], False
+                if target <= self.written:
+                    return True
+                snapshot = None
+                if full or self.storage.needs_snapshot(bool(bills), len(dirty)):
+                    snapshot = self.storage.snapshot(self.rooms)
+                records = {room_num: self.rooms[room_num].to_record() for room_num in dirty}
+
+            success = self.storage.commit(records, bills, snapshot, ledger_entries)
+
+            with self.condition:
+                if success:
+                    self.written = max(self.written, target)
+                else:
+                    # إعادة التعديلات للمحاولة التالية بنفس ترتيبها
+                    self.dirty |= dirty
+                    self.bills = bills + self.bills
+                    self.ledger_entries = ledger_entries + self.ledger_entries
+                    self.full = self.full or full
+                self.condition.notify_all()
+            return success
+
+    def wait_durable(self, timeout=None):
+        # انتظار كتابة كل التعديلات المطلوبة حتى الآن
+        with self.condition:
+            target = self.submitted
+            return self.condition.wait_for(lambda: self.written >= target, timeout)
+
+    def flush(self):
+        # كتابة فورية لما تبقى، تستخدم عند الخروج
+        return self.write_pending()
+
+
+def make_storage(backend="json"):
+    if backend == "sqlite":
+        return SqliteStorage()
+    if backend == "sharded":
+        return ShardedJsonStorage()
+    if backend == "indexed":
+        return IndexedStorage()
+    if backend == "binary":
+        return BinaryStorage()
+    return JsonStorage()
@@ -0,0 +1,73 @@
+import room_manager
+from room_manager import HISTORY_CONFLICT_MESSAGE, RoomManager
+from storage import JsonStorage
+
+ROSTER = "room,name,has_laptop,no_laptop,balance\n11,أحمد,1,2,0\n12,سالم,0,3,0\n21,خالد,2,0,0\n"
+
+GUI = ("gui", 1)
+API = ("api", "tool")
+
+
+def open_manager(tmp_path):
+    manager = RoomManager(JsonStorage(str(tmp_path / "rooms_data.json"), str(tmp_path / "rooms_data.journal"),
+                                      str(tmp_path / "rooms_ledger.jsonl")))
+    roster = tmp_path / "roster.csv"
+    roster.write_text(ROSTER, encoding='utf-8')
+    manager.import_roster(str(roster))
+    return manager
+
+
+def balances(manager):
+    return {room_num: manager.rooms[room_num].balance for room_num in ("11", "12", "21")}
+
+
+def test_session_cannot_undo_other_sessions_changes(tmp_path):
+    manager = open_manager(tmp_path)
+    manager.apply_bill_to_rooms(10, 20, session=GUI)
+    after_bill = balances(manager)
+
+    success, _ = manager.undo(session=API)
+    assert not success
+    assert balances(manager) == after_bill
+
+    success, _ = manager.undo(session=GUI)
+    assert success
+    assert balances(manager) == {"11": 0, "12": 0, "21": 0}
+
+
+def test_bill_undo_refused_until_other_sessions_payment_is_undone(tmp_path):
+    manager = open_manager(tmp_path)
+    manager.apply_bill_to_rooms(10, 20, session=GUI)
+    assert manager.pay_room_bill("11", 5, session=API)[0]
+
+    assert manager.undo(session=GUI) == (False, HISTORY_CONFLICT_MESSAGE)
+    assert manager.rooms["11"].balance == 45
+
+    assert manager.undo(session=API)[0]
+    assert manager.undo(session=GUI)[0]
+    assert balances(manager) == {"11": 0, "12": 0, "21": 0}
+
+
+def test_redo_refused_after_other_session_changes_room(tmp_path):
+    manager = open_manager(tmp_path)
+    manager.apply_bill_to_rooms(10, 20, session=GUI)
+    assert manager.undo(session=GUI)[0]
+    manager.apply_bill_to_rooms(1, 0, session=API)
+
+    assert manager.redo(session=GUI) == (False, HISTORY_CONFLICT_MESSAGE)
+    assert manager.undo(session=API)[0]
+    assert manager.redo(session=GUI)[0]
+    assert balances(manager) == {"11": 50, "12": 30, "21": 60}
+
+
+def test_session_histories_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(room_manager, "HISTORY_SESSIONS", 2)
+    manager = open_manager(tmp_path)
+    manager.apply_bill_to_rooms(10, 20, session=GUI)
+    manager.undo(session=("api", "a"))
+    assert manager.undo(session=GUI)[0]
+    manager.undo(session=("api", "b"))
+
+    # الجلسة التي استخدمت مؤخراً تبقى والأقدم استخداماً يحذف تاريخها
+    assert list(manager.histories) == [GUI, ("api", "b")]
+    assert manager.redo(session=GUI)[0]
@@ -0,0 +1,54 @@
+from array import array
+
+import pytest
+
+from snapshot import HEADER, SNAPSHOT_MAGIC, columns_from_records, decode_snapshot, encode_snapshot
+
+RECORDS = {
+    "1112": ["أحمد", 1, 2, 30.25],
+    "13": ["", 0, 0, 0.0],
+    "2122": ["سالم علي", 3, 1, -4.5],
+}
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_snapshot_round_trip(compress):
+    columns = columns_from_records(RECORDS)
+    numbers, names, has_laptop, no_laptop, balance = decode_snapshot(encode_snapshot(*columns, compress=compress))
+    assert numbers == list(RECORDS)
+    assert names == [record[0] for record in RECORDS.values()]
+    assert has_laptop == array('q', [1, 0, 3])
+    assert no_laptop == array('q', [2, 0, 1])
+    assert balance == array('d', [30.25, 0.0, -4.5])
+
+
+def test_snapshot_round_trip_empty():
+    assert decode_snapshot(encode_snapshot(*columns_from_records({}))) == ([], [], array('q'), array('q'), array('d'))
+
+
+@pytest.mark.parametrize("size", [0, HEADER.size - 1, HEADER.size, HEADER.size + 10])
+def test_snapshot_truncated(size):
+    data = encode_snapshot(*columns_from_records(RECORDS))
+    with pytest.raises(ValueError):
+        decode_snapshot(data[:size])
+
+
+def test_snapshot_checksum_mismatch():
+    data = bytearray(encode_snapshot(*columns_from_records(RECORDS)))
+    data[HEADER.size + 3] ^= 0x01
+    with pytest.raises(ValueError):
+        decode_snapshot(bytes(data))
+
+
+def test_snapshot_rejects_other_files_and_versions():
+    data = encode_snapshot(*columns_from_records(RECORDS))
+    with pytest.raises(ValueError):
+        decode_snapshot(b"NOTROOMS" + data[8:])
+    magic, version, flags, count, length, checksum = HEADER.unpack_from(data)
+    with pytest.raises(ValueError):
+        decode_snapshot(HEADER.pack(SNAPSHOT_MAGIC, version + 1, flags, count, length, checksum) + data[HEADER.size:])
+
+
+def test_snapshot_rejects_names_with_separator():
+    with pytest.raises(ValueError):
+        encode_snapshot(["1"], ["a\0b"], [0], [0], [0.0])
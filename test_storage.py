@@ -0,0 +1,194 @@
+import json
+import os
+
+import pytest
+
+import storage
+from room_manager import RoomManager
+from storage import BinaryStorage, IndexedStorage, JsonStorage
+
+ROOMS = {
+    "11": ["أحمد", 1, 2, 30.0],
+    "12": ["سالم", 0, 3, 0.0],
+    "21": ["خالد", 2, 0, 12.5],
+}
+
+
+def open_json(tmp_path):
+    return JsonStorage(str(tmp_path / "rooms_data.json"), str(tmp_path / "rooms_data.journal"),
+                       str(tmp_path / "rooms_ledger.jsonl"))
+
+
+def test_json_corrupt_file_is_kept_and_stops_room_manager(tmp_path):
+    json_storage = open_json(tmp_path)
+    assert json_storage.save(ROOMS)
+    path = tmp_path / "rooms_data.json"
+    data = path.read_bytes()[:-10]
+    path.write_bytes(data)
+
+    # السجل الفارغ بعد الحفظ لا يجعل الملف التالف يحمل كجدول فارغ
+    with pytest.raises(ValueError):
+        open_json(tmp_path).load()
+    with pytest.raises(ValueError):
+        RoomManager(open_json(tmp_path))
+    assert path.read_bytes() == data
+    assert not os.path.exists(tmp_path / "rooms_ledger.jsonl")
+
+
+def test_json_missing_file_uses_defaults(tmp_path):
+    manager = RoomManager(open_json(tmp_path))
+    assert manager.rooms.get("13") is not None
+    assert open_json(tmp_path).load() is not None
+
+
+def open_indexed(tmp_path):
+    return IndexedStorage(str(tmp_path / "rooms_data"), migrate_from=None,
+                          ledger_file=str(tmp_path / "rooms_ledger.jsonl"))
+
+
+def test_indexed_round_trip(tmp_path):
+    indexed = open_indexed(tmp_path)
+    assert indexed.save(ROOMS)
+    indexed.close()
+
+    indexed = open_indexed(tmp_path)
+    assert indexed.room_count() == 3
+    assert indexed.load() == ROOMS
+    assert indexed.read_room("21") == ROOMS["21"]
+    assert indexed.read_room("99") is None
+    assert indexed.read_room(None) is None
+    assert indexed.load_summaries()["1"] == [1, 5, 30.0, 2]
+    indexed.close()
+
+
+def test_indexed_appended_records_survive_reopen(tmp_path):
+    indexed = open_indexed(tmp_path)
+    indexed.save(ROOMS)
+    assert indexed.save({"12": ["سالم", 0, 3, 7.0], "31": ["جديد", 1, 0, 0.0]})
+    indexed.close()
+
+    indexed = open_indexed(tmp_path)
+    assert indexed.room_count() == 4
+    assert indexed.read_room("12") == ["سالم", 0, 3, 7.0]
+    assert indexed.room_numbers(0, 10) == ["11", "12", "21", "31"]
+    assert indexed.load_summaries()["1"][2] == 37.0
+    indexed.close()
+
+
+def test_indexed_drops_torn_tail(tmp_path):
+    indexed = open_indexed(tmp_path)
+    indexed.save(ROOMS)
+    indexed.save({"11": ["أحمد", 1, 2, 40.0]})
+    path = indexed.data_path(indexed.generation)
+    valid_size = os.path.getsize(path)
+    indexed.close()
+
+    # سطر غير مكتمل كما يتركه انقطاع أثناء الكتابة
+    with open(path, 'ab') as f:
+        f.write(b'["12", "\xd8\xb3\xd8\xa7\xd9\x84\xd9\x85", 0, 3, 99')
+
+    indexed = open_indexed(tmp_path)
+    assert os.path.getsize(path) == valid_size
+    assert indexed.read_room("11") == ["أحمد", 1, 2, 40.0]
+    assert indexed.read_room("12") == ROOMS["12"]
+
+    # الكتابة بعد الإصلاح تضاف بعد آخر سطر سليم
+    assert indexed.save({"12": ["سالم", 0, 3, 5.0]})
+    indexed.close()
+    indexed = open_indexed(tmp_path)
+    assert indexed.read_room("12") == ["سالم", 0, 3, 5.0]
+    indexed.close()
+
+
+def test_indexed_compaction_rewrites_data_and_index(tmp_path, monkeypatch):
+    indexed = open_indexed(tmp_path)
+    indexed.rewrite(ROOMS)
+    generation = indexed.generation
+    monkeypatch.setattr(storage, "INDEX_COMPACT_THRESHOLD", 3)
+    old_path = indexed.data_path(generation)
+
+    indexed.save({"11": ["أحمد", 1, 2, 1.0]})
+    assert indexed.generation == generation
+    indexed.save({"12": ["سالم", 0, 3, 2.0], "41": ["جديد", 0, 1, 0.0]})
+    assert indexed.generation == generation + 1
+    assert not os.path.exists(old_path)
+    assert indexed.overlay == {}
+    indexed.close()
+
+    indexed = open_indexed(tmp_path)
+    assert indexed.room_count() == 4
+    assert indexed.load() == {
+        "11": ["أحمد", 1, 2, 1.0],
+        "12": ["سالم", 0, 3, 2.0],
+        "21": ROOMS["21"],
+        "41": ["جديد", 0, 1, 0.0],
+    }
+    indexed.close()
+
+
+def open_binary(tmp_path):
+    return BinaryStorage(str(tmp_path / "rooms_data.bin"), str(tmp_path / "rooms_data.journal"),
+                         migrate_from=str(tmp_path / "rooms_data.json"),
+                         ledger_file=str(tmp_path / "rooms_ledger.jsonl"))
+
+
+def test_binary_corrupt_snapshot_is_kept_and_not_replaced_by_json(tmp_path):
+    # ملف JSON القديم من قبل التحويل بأرصدة قديمة
+    old_rooms = {room_num: record[:3] + [0.0] for room_num, record in ROOMS.items()}
+    with open(tmp_path / "rooms_data.json", 'w', encoding='utf-8') as f:
+        json.dump(old_rooms, f, ensure_ascii=False)
+    binary = open_binary(tmp_path)
+    assert binary.save(ROOMS)
+
+    path = tmp_path / "rooms_data.bin"
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError):
+        open_binary(tmp_path).load_table()
+    assert path.read_bytes() == bytes(data)
+
+
+def test_binary_corrupt_snapshot_stops_room_manager_without_ledger_entries(tmp_path):
+    binary = open_binary(tmp_path)
+    assert binary.save(ROOMS)
+    path = tmp_path / "rooms_data.bin"
+    path.write_bytes(path.read_bytes()[:-5])
+
+    with pytest.raises(ValueError):
+        RoomManager(open_binary(tmp_path))
+    assert not os.path.exists(tmp_path / "rooms_ledger.jsonl")
+    assert len(path.read_bytes()) > 0
+
+
+def test_binary_migrates_json_only_when_snapshot_is_missing(tmp_path):
+    with open(tmp_path / "rooms_data.json", 'w', encoding='utf-8') as f:
+        json.dump(ROOMS, f, ensure_ascii=False)
+
+    table = open_binary(tmp_path).load_table()
+    assert table.to_records() == ROOMS
+    assert os.path.exists(tmp_path / "rooms_data.bin")
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_binary_round_trip(tmp_path, compress):
+    binary = open_binary(tmp_path)
+    binary.compress = compress
+    assert binary.save(ROOMS)
+    assert open_binary(tmp_path).load() == ROOMS
+
+
+def test_binary_replays_journal_and_drops_torn_line(tmp_path):
+    binary = open_binary(tmp_path)
+    binary.save(ROOMS)
+    assert binary.write_records({"12": ["سالم", 0, 3, 8.0]}, None)
+    with open(tmp_path / "rooms_data.journal", 'a', encoding='utf-8') as f:
+        f.write('["21", ["خالد", 2, 0, 9')
+
+    binary = open_binary(tmp_path)
+    table = binary.load_table()
+    assert table.to_records() == {**ROOMS, "12": ["سالم", 0, 3, 8.0]}
+    # السجل التالف يدمج في لقطة جديدة ويفرغ
+    assert os.path.getsize(tmp_path / "rooms_data.journal") == 0
+    assert open_binary(tmp_path).load() == table.to_records()